@@ -22,16 +22,24 @@ qconfig.check_python_version()
 from site import addsitedir
 addsitedir(os.path.join(qconfig.LIBS_LOCATION, 'site_packages'))
 from quast_libs.metautils import Assembly, correct_meta_references, correct_assemblies, \
-    get_downloaded_refs_with_alignments, partition_contigs, calculate_ave_read_support
-from quast_libs.options_parser import parse_options, remove_from_quast_py_args, prepare_regular_quast_args
+    get_downloaded_refs_with_alignments, partition_contigs, calculate_ave_read_support, \
+    reuse_combined_alignments
+from quast_libs.options_parser import parse_options, prepare_regular_quast_args
 
 from quast_libs import contigs_analyzer, search_references_meta, plotter_data, qutils
-from quast_libs.qutils import cleanup, check_dirpath, is_python2, run_parallel
+from quast_libs.qutils import cleanup, check_dirpath, is_python2
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_META_NAME)
 logger.set_up_console_handler()
 
+# Estimate of the peak memory of quast.py run for one reference. The run keeps at most a few copies of its sequences
+# at once: read_fasta joins sequences from lines (2 bytes per base), genome_analyzer maps the reference with one
+# byte per base, alignments and contig sequences are kept during contigs analysis. These sum up to 3-4 bytes per byte
+# of the input, the factor leaves about two times more for Python objects, plus the memory of the interpreter itself.
+PER_REF_RUN_BASE_MEMORY = 0.2  # GB
+PER_REF_RUN_MEMORY_FACTOR = 10  # bytes of memory per byte of reference and contigs
+
 
 def _start_quast_main(args, assemblies, reference_fpath=None, output_dirpath=None, num_notifications_tuple=None,
                       labels=None, run_regular_quast=False, is_combined_ref=False, is_parallel_run=False):
@@ -105,6 +113,99 @@ def _run_quast_per_ref(quast_py_args, output_dirpath_per_ref, ref_fpath, ref_ass
         return ref_name, json_text, total_num_notifications
 
 
+def _estimate_run_memory(ref_fpath, ref_assemblies):
+    """
+        Rough peak memory (in GB) of quast.py run for one reference, used to bound the number of parallel runs
+    """
+    input_size = os.path.getsize(ref_fpath) + sum(os.path.getsize(asm.fpath) for asm in ref_assemblies)
+    return PER_REF_RUN_BASE_MEMORY + PER_REF_RUN_MEMORY_FACTOR * input_size / 1024 ** 3
+
+
+def _get_per_ref_workers_num(jobs_memory):
+    """
+        Number of quast.py runs executed at once: limited by threads and by memory needed for the largest runs
+    """
+    if qconfig.memory_efficient:
+        return 1
+    workers_num = min(qconfig.max_threads, len(jobs_memory))
+    free_memory = qutils.get_available_memory()
+    if free_memory is None:
+        return max(1, workers_num)
+    required_memory = 0
+    for i, job_memory in enumerate(sorted(jobs_memory, reverse=True)[:workers_num]):
+        required_memory += job_memory
+        if required_memory > free_memory:
+            workers_num = i
+            break
+    return max(1, workers_num)
+
+
+def _run_quast_per_ref_job(job):
+    job_idx, args = job
+    try:
+        return job_idx, _run_quast_per_ref(*args), None
+    except SystemExit as e:  # a worker which exits never returns the result, so the exit is passed to the main process
+        return job_idx, None, e.code
+
+
+def _run_quast_per_refs(quast_py_args, output_dirpath_per_ref, assemblies_by_reference, total_num_notifications):
+    """
+        Runs quast.py for all references on one pool of processes. The longest references are started first,
+        so they do not delay the end of the whole stage, and the results are collected as soon as runs finish.
+        Returns names and JSON texts of the runs in the order of assemblies_by_reference
+    """
+    jobs = []
+    for ref_fpath, ref_assemblies in assemblies_by_reference:
+        if ref_assemblies:
+            jobs.append((ref_fpath, ref_assemblies))
+        else:
+            _run_quast_per_ref(quast_py_args, output_dirpath_per_ref, ref_fpath, ref_assemblies, total_num_notifications)
+    if not jobs:
+        return [], [], total_num_notifications
+
+    jobs.sort(key=lambda job: os.path.getsize(job[0]), reverse=True)
+    workers_num = _get_per_ref_workers_num([_estimate_run_memory(ref_fpath, ref_assemblies)
+                                            for ref_fpath, ref_assemblies in jobs])
+    results = [None] * len(jobs)
+    if workers_num == 1:
+        for job_idx, (ref_fpath, ref_assemblies) in enumerate(jobs):
+            results[job_idx] = _run_quast_per_ref(quast_py_args, output_dirpath_per_ref, ref_fpath, ref_assemblies,
+                                                  (0, 0, 0))
+    else:
+        logger.main_info()
+        logger.main_info('Run QUAST on different references in parallel (%d runs at once)..' % workers_num)
+        threads_per_ref = max(1, qconfig.max_threads // workers_num)
+        run_args = quast_py_args + ['--memory-efficient', '-t', str(threads_per_ref)]
+        parallel_jobs = [(job_idx, (run_args, output_dirpath_per_ref, ref_fpath, ref_assemblies, (0, 0, 0), True))
+                         for job_idx, (ref_fpath, ref_assemblies) in enumerate(jobs)]
+        from multiprocessing import Pool
+        # a new process for each run: quast.py changes global state of modules and the memory is released after a run
+        pool = Pool(workers_num, maxtasksperchild=1)
+        try:
+            for finished_num, (job_idx, result, exit_code) in enumerate(pool.imap_unordered(_run_quast_per_ref_job, parallel_jobs)):
+                if result is None:
+                    sys.exit(exit_code)
+                results[job_idx] = result
+                logger.main_info('  Finished quast.py for the contigs aligned to %s (%d of %d)' %
+                                 (result[0], finished_num + 1, len(jobs)))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    order = dict((ref_fpath, i) for i, (ref_fpath, _) in enumerate(assemblies_by_reference))
+    ref_names, json_texts = [], []
+    for job_idx in sorted(range(len(jobs)), key=lambda job_idx: order[jobs[job_idx][0]]):
+        ref_name, json_text, num_notifications = results[job_idx]
+        total_num_notifications = list(map(sum, zip(total_num_notifications, num_notifications)))
+        if ref_name:
+            ref_names.append(ref_name)
+            json_texts.append(json_text)
+    return ref_names, json_texts, total_num_notifications
+
+
 def main(args):
     check_dirpath(qconfig.QUAST_HOME, 'You are trying to run it from ' + str(qconfig.QUAST_HOME) + '.\n' +
                   'Please, put QUAST in a different directory, then try again.\n', exit_code=3)
@@ -118,6 +219,7 @@ def main(args):
     output_dirpath, ref_fpaths, labels = qconfig.output_dirpath, qconfig.reference, qconfig.labels
     html_report = qconfig.html_report
     test_mode = qconfig.test
+    reuse_alignments = qconfig.reuse_combined_alignments
 
     # Directories
     output_dirpath, _, _ = qutils.set_up_output_dir(
@@ -308,35 +410,13 @@ def main(args):
         os.path.join(combined_output_dirpath, 'contigs_reports', 'alignments_%s.tsv'), labels)
 
     output_dirpath_per_ref = os.path.join(output_dirpath, qconfig.per_ref_dirname)
-    if not qconfig.memory_efficient and \
-                    len(assemblies_by_reference) > len(assemblies) and len(assemblies) < qconfig.max_threads:
-        logger.main_info()
-        logger.main_info('Run QUAST on different references in parallel..')
-        threads_per_ref = max(1, qconfig.max_threads // len(assemblies_by_reference))
-        quast_py_args += ['--memory-efficient']
-        quast_py_args += ['-t', str(threads_per_ref)]
-
-        num_notifications = (0, 0, 0)
-        parallel_run_args = [(quast_py_args, output_dirpath_per_ref, ref_fpath, ref_assemblies, num_notifications, True)
-                             for ref_fpath, ref_assemblies in assemblies_by_reference]
-        ref_names, ref_json_texts, ref_notifications = \
-            run_parallel(_run_quast_per_ref, parallel_run_args, qconfig.max_threads, filter_results=True)
-        per_ref_num_notifications = list(map(sum, zip(*ref_notifications)))
-        total_num_notifications = list(map(sum, zip(total_num_notifications, per_ref_num_notifications)))
-        if json_texts is not None:
-            json_texts.extend(ref_json_texts)
-        quast_py_args.remove('--memory-efficient')
-        quast_py_args = remove_from_quast_py_args(quast_py_args, '-t', str(threads_per_ref))
-    else:
-        ref_names = []
-        for ref_fpath, ref_assemblies in assemblies_by_reference:
-            ref_name, json_text, total_num_notifications = \
-                _run_quast_per_ref(quast_py_args, output_dirpath_per_ref, ref_fpath, ref_assemblies, total_num_notifications)
-            if not ref_name:
-                continue
-            ref_names.append(ref_name)
-            if json_texts is not None:
-                json_texts.append(json_text)
+    if reuse_alignments:
+        logger.main_info('Reusing alignments to the combined reference for runs per reference..')
+        reuse_combined_alignments(combined_output_dirpath, output_dirpath_per_ref, assemblies_by_reference)
+    ref_names, ref_json_texts, total_num_notifications = \
+        _run_quast_per_refs(quast_py_args, output_dirpath_per_ref, assemblies_by_reference, total_num_notifications)
+    if json_texts is not None:
+        json_texts.extend(ref_json_texts)
 
     # Finally running for the contigs that has not been aligned to any reference
     no_unaligned_contigs = True
@@ -18,7 +18,7 @@ qconfig.check_python_version()
 
 from site import addsitedir
 addsitedir(os.path.join(qconfig.LIBS_LOCATION, 'site_packages'))
-from quast_libs import qutils, run_barrnap, plotter_data, unique_kmers
+from quast_libs import qutils, run_barrnap, plotter_data, unique_kmers, reference_profile
 from quast_libs.qutils import cleanup, check_dirpath, check_reads_fpaths
 from quast_libs.options_parser import parse_options
 
@@ -86,6 +86,7 @@ def main(args):
         logger.main_info('Reference:')
         original_ref_fpath = ref_fpath
         ref_fpath = qutils.correct_reference(ref_fpath, corrected_dirpath)
+        reference_profile.create(ref_fpath, corrected_dirpath)
         if qconfig.optimal_assembly:
             if not qconfig.pacbio_reads and not qconfig.nanopore_reads and not qconfig.mate_pairs:
                 logger.warning('Upper Bound Assembly cannot be created. It requires mate-pairs or long reads (Pacbio SMRT or Oxford Nanopore).')
@@ -80,4 +80,68 @@ def E_size(numlist):
     for num in numlist:
         E_size += num * num
         G += num
-    return int(E_size / G)
\ No newline at end of file
+    return int(E_size / G)
+
+
+def _merge_runs(runs, total_length=None):
+    histogram = {}
+    for value, run_length in runs:
+        histogram[value] = histogram.get(value, 0) + run_length
+    covered_length = sum(histogram.values())
+    if total_length is None:
+        total_length = covered_length
+    assert total_length >= covered_length
+    if total_length > covered_length:
+        histogram[0] = histogram.get(0, 0) + total_length - covered_length
+    return sorted(histogram.items(), reverse=True), total_length
+
+
+def weighted_percentiles(runs, total_length=None):
+    """
+    Abstract: Returns 101 values: x-th (x = 0..100) percentiles of per-base values sorted in descending order.
+    Comments: Per-base values are given as (value, run_length) pairs, e.g. a run-length encoding of
+              per-base maxima (EAx, strict EAx, Ex). Bases not covered by runs up to total_length count as zeros.
+              Equals to [values[len(values) * x // 100] for x in range(100)] + [values[-1]] for the expanded
+              per-base list of values sorted in descending order.
+    Usage: weighted_percentiles([(value, run_length), ...], total_length)
+    """
+    return weighted_x_max_stats(runs, total_length)[0]
+
+
+def weighted_mean(runs, total_length=None):
+    """
+    Abstract: Returns the integer mean of per-base values given as (value, run_length) pairs.
+    Usage: weighted_mean([(value, run_length), ...], total_length)
+    """
+    return weighted_x_max_stats(runs, total_length)[1]
+
+
+def weighted_fraction_not_less(runs, threshold, total_length=None):
+    """
+    Abstract: Returns the fraction of bases with values not less than threshold (e.g. P5k, P10k).
+    Usage: weighted_fraction_not_less([(value, run_length), ...], threshold, total_length)
+    """
+    return weighted_x_max_stats(runs, total_length, [threshold])[2][0]
+
+
+def weighted_x_max_stats(runs, total_length=None, thresholds=()):
+    """
+    Abstract: Returns percentiles, mean and fractions of bases with values not less than each of thresholds
+              of per-base values given as (value, run_length) pairs. Works in O(k log k) for k distinct values.
+    Usage: x_max, mean_max, (p5k, p10k) = weighted_x_max_stats([(value, run_length), ...], total_length, [5000, 10000])
+    """
+    values, total_length = _merge_runs(runs, total_length)
+    assert total_length > 0
+    x_max = [0] * 101
+    i = 0
+    passed_length = 0
+    for value, run_length in values:
+        passed_length += run_length
+        while i < 100 and (total_length * i) // 100 < passed_length:
+            x_max[i] = value
+            i += 1
+    x_max[100] = values[-1][0]
+    mean_max = int(sum(value * run_length for value, run_length in values) / total_length)
+    fractions = [sum(run_length for value, run_length in values if value >= threshold) / total_length
+                 for threshold in thresholds]
+    return x_max, mean_max, fractions
@@ -7,7 +7,7 @@
 
 import os
 import itertools
-from quast_libs import fastaparser, N50, plotter, reporting, qconfig, qutils
+from quast_libs import fastaparser, N50, plotter, reporting, qconfig, qutils, reference_profile
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
@@ -29,7 +29,7 @@ def do(ref_fpath, contigs_fpaths, aligned_contigs_fpaths, output_dirpath,
     logger.print_timestamp()
     logger.main_info('Running NA-NGA calculation...')
 
-    ref_chr_lengths = fastaparser.get_chr_lengths_from_fastafile(ref_fpath)
+    ref_chr_lengths = reference_profile.get(ref_fpath).chr_lengths
     reference_length = sum(ref_chr_lengths.values())
     assembly_lengths = []
     for contigs_fpath in aligned_contigs_fpaths:
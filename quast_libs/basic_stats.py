@@ -11,89 +11,139 @@ import os
 import re
 from os.path import join
 
-from quast_libs import fastaparser, qconfig, qutils, reporting, plotter
+from quast_libs import fastaparser, qconfig, qutils, reporting, plotter, reference_profile
 from quast_libs.circos import set_window_size
 from quast_libs.log import get_logger
+from quast_libs.qutils import run_parallel
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 MIN_HISTOGRAM_POINTS = 5
+cov_pattern = re.compile(r'_cov_(\d+\.?\d*)')
 
 
-def GC_content(contigs_fpath, skip=False):
+def _empty_GC_distributions():
     """
-       Returns percent of GC for assembly and GC distribution: (list of GC%, list of # windows)
+       Returns empty GC distributions of windows and of contigs: (list of GC%, list of # windows or # contigs)
     """
-    total_GC_amount = 0
-    total_contig_length = 0
+    GC_bin_num = int(100 / qconfig.GC_bin_size) + 1
+    GC_distribution_x = [i * qconfig.GC_bin_size for i in range(0, GC_bin_num)] # list of X-coordinates, i.e. GC %
+    GC_distribution_y = [0] * GC_bin_num # list of Y-coordinates, i.e. # windows with GC % = x
+
     GC_contigs_bin_num = int(100 / qconfig.GC_contig_bin_size) + 1
     GC_contigs_distribution_x = [i * qconfig.GC_contig_bin_size for i in range(0, GC_contigs_bin_num)] # list of X-coordinates, i.e. GC %
     GC_contigs_distribution_y = [0] * GC_contigs_bin_num # list of Y-coordinates, i.e. # contigs with GC % = x
+    return (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
 
-    GC_bin_num = int(100 / qconfig.GC_bin_size) + 1
-    GC_distribution_x = [i * qconfig.GC_bin_size for i in range(0, GC_bin_num)] # list of X-coordinates, i.e. GC %
-    GC_distribution_y = [0] * GC_bin_num # list of Y-coordinates, i.e. # windows with GC % = x
-    total_GC = None
-    if skip:
-        return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
 
-    for name, seq_full in fastaparser.read_fasta(contigs_fpath): # in tuples: (name, seq)
-        contig_ACGT_len = len(seq_full) - seq_full.count("N")
-        if not contig_ACGT_len:
-            continue
-        contig_GC_len = seq_full.count("G") + seq_full.count("C")
-        contig_GC_percent = 100.0 * contig_GC_len / contig_ACGT_len
-        GC_contigs_distribution_y[int(contig_GC_percent // qconfig.GC_contig_bin_size)] += 1
-
-        n = 100 # blocks of length 100
-        # non-overlapping windows
-        for seq in (seq_full[i:i+n] for i in range(0, len(seq_full), n)):
-            GC_percent = get_GC_percent(seq, n)
-            if not GC_percent:
-                continue
-            GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += 1
-        total_GC_amount += contig_GC_len
-        total_contig_length += contig_ACGT_len
-
-    if total_contig_length == 0:
-        total_GC = None
+def add_GC_counts(seq_full, GC_distribution_y, GC_contigs_distribution_y):
+    """
+       Adds contig (bytes) to GC distributions, returns numbers of its GC and non-N letters
+    """
+    n = reference_profile.GC_DISTRIBUTION_WINDOW_SIZE # blocks of length 100
+    if len(seq_full) <= n:  # a single window, short contigs are counted without splitting into windows
+        ACGT_lens = [len(seq_full) - seq_full.count(b'N')]
+        GC_lens = [seq_full.count(b'G') + seq_full.count(b'C')]
     else:
-        total_GC = total_GC_amount * 100.0 / total_contig_length
+        # non-overlapping windows, counted in one pass over the sequence
+        ACGT_lens, GC_lens = fastaparser.count_GC_in_windows(seq_full, n)
+    contig_ACGT_len = sum(ACGT_lens)
+    if not contig_ACGT_len:
+        return 0, 0
+    contig_GC_len = sum(GC_lens)
+    contig_GC_percent = 100.0 * contig_GC_len / contig_ACGT_len
+    GC_contigs_distribution_y[int(contig_GC_percent // qconfig.GC_contig_bin_size)] += 1
+
+    for ACGT_len, GC_len in zip(ACGT_lens, GC_lens):
+        GC_percent = get_GC_percent_by_counts(ACGT_len, GC_len, n)
+        if not GC_percent:
+            continue
+        GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += 1
+    return contig_GC_len, contig_ACGT_len
 
-    return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
+
+def reference_GC_content(ref_profile):
+    """
+       Returns percent of GC for reference and GC distribution: (list of GC%, list of # windows)
+    """
+    (GC_distribution_x, GC_distribution_y), _ = _empty_GC_distributions()
+    n = reference_profile.GC_DISTRIBUTION_WINDOW_SIZE
+    for (ACGT_len, GC_len), windows in ref_profile.GC_windows_histogram.items():
+        GC_percent = get_GC_percent_by_counts(ACGT_len, GC_len, n)
+        if not GC_percent:
+            continue
+        GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += windows
+    return ref_profile.total_GC, (GC_distribution_x, GC_distribution_y)
 
 
 def get_GC_percent(seq, n):
-    ACGT_len = len(seq) - seq.count("N")
+    return get_GC_percent_by_counts(len(seq) - seq.count("N"), seq.count("G") + seq.count("C"), n)
+
+
+def get_GC_percent_by_counts(ACGT_len, GC_len, n):
     # skip block if it has less than half of ACGT letters (it also helps with "ends of contigs")
     if ACGT_len < n // 2:
         return 0
 
-    GC_len = seq.count("G") + seq.count("C")
     GC_percent = 100.0 * GC_len / ACGT_len
     return GC_percent
 
 
 def save_icarus_GC(ref_fpath, gc_fpath):
     chr_index = 0
-    n = qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size  # non-overlapping windows
+    n = reference_profile.get_icarus_window_size()  # non-overlapping windows
+    ref_profile = reference_profile.get(ref_fpath)
     with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
+        for name, (ACGT_lens, GC_lens) in ref_profile.GC_windows[n].items():
             out_f.write('#' + name + ' ' + str(chr_index) + '\n')
-            for i in range(0, len(seq_full), n):
-                seq = seq_full[i:i + n]
-                GC_percent = get_GC_percent(seq, n)
+            for ACGT_len, GC_len in zip(ACGT_lens, GC_lens):
+                GC_percent = get_GC_percent_by_counts(ACGT_len, GC_len, n)
                 out_f.write(str(chr_index) + ' ' + str(GC_percent) + '\n')
 
 
 def save_circos_GC(ref_fpath, reference_length, gc_fpath):
     window_size = set_window_size(reference_length)
+    ref_profile = reference_profile.get(ref_fpath)
     with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
-            for i in range(0, len(seq_full), window_size):
-                seq = seq_full[i:i + window_size]
-                GC_percent = get_GC_percent(seq, window_size)
+        for name, (ACGT_lens, GC_lens) in ref_profile.GC_windows[window_size].items():
+            for i, (ACGT_len, GC_len) in zip(range(0, ref_profile.chr_lengths[name], window_size), zip(ACGT_lens, GC_lens)):
+                GC_percent = get_GC_percent_by_counts(ACGT_len, GC_len, window_size)
                 out_f.write('\t'.join([name, str(i), str(i + window_size), str(GC_percent) + '\n']))
 
 
+def process_single_file(contigs_fpath):
+    """
+       Reads assembly once.
+       Returns contig names, contig lengths, # N's, # bases by coverage (from contig names) and GC content
+       (percent of GC, GC distribution of windows and GC distribution of contigs)
+    """
+    names = []
+    lengths = []
+    number_of_Ns = 0
+    coverage = []
+    GC_amount = 0
+    ACGT_length = 0
+    GC_distribution, GC_contigs_distribution = _empty_GC_distributions()
+    if qconfig.no_gc:
+        entries = ((name, None, seq_len, seq_Ns) for name, seq_len, seq_Ns in fastaparser.read_fasta_stats(contigs_fpath))
+    else:
+        entries = ((name, seq, len(seq), seq.count(b'N')) for name, seq in fastaparser.read_fasta_bytes(contigs_fpath))
+    for name, seq, seq_len, seq_Ns in entries:
+        names.append(name)
+        lengths.append(seq_len)
+        number_of_Ns += seq_Ns
+        if cov_pattern.findall(name):
+            cov = int(float(cov_pattern.findall(name)[0]))
+            if len(coverage) <= cov:
+                coverage += [0] * (cov - len(coverage) + 1)
+            coverage[cov] += seq_len
+        if seq is not None:
+            contig_GC_len, contig_ACGT_len = add_GC_counts(seq, GC_distribution[1], GC_contigs_distribution[1])
+            GC_amount += contig_GC_len
+            ACGT_length += contig_ACGT_len
+
+    total_GC = GC_amount * 100.0 / ACGT_length if ACGT_length else None
+    return names, lengths, number_of_Ns, coverage, (total_GC, GC_distribution, GC_contigs_distribution)
+
+
 def binning_coverage(cov_values, nums_contigs):
     min_bins_cnt = 5
     bin_sizes = []
@@ -184,10 +234,11 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
     icarus_gc_fpath = None
     circos_gc_fpath = None
     if ref_fpath:
-        reference_lengths = sorted(fastaparser.get_chr_lengths_from_fastafile(ref_fpath).values(), reverse=True)
+        ref_profile = reference_profile.get(ref_fpath)
+        reference_lengths = sorted(ref_profile.chr_lengths.values(), reverse=True)
         reference_fragments = len(reference_lengths)
         reference_length = sum(reference_lengths)
-        reference_GC, reference_GC_distribution, reference_GC_contigs_distribution = GC_content(ref_fpath)
+        reference_GC, reference_GC_distribution = reference_GC_content(ref_profile)
         if qconfig.create_icarus_html or qconfig.draw_plots:
             icarus_gc_fpath = join(output_dirpath, 'gc.icarus.txt')
             save_icarus_GC(ref_fpath, icarus_gc_fpath)
@@ -208,33 +259,18 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
         logger.info('  Estimated reference length = ' + str(reference_length))
 
     logger.info('  Contig files: ')
-    lists_of_lengths = []
-    contig_length_map = {}
-    numbers_of_Ns = []
-    coverage_dict = dict()
-    cov_pattern = re.compile(r'_cov_(\d+\.?\d*)')
     for id, contigs_fpath in enumerate(contigs_fpaths):
-        coverage_dict[contigs_fpath] = []
-        assembly_label = qutils.label_from_fpath(contigs_fpath)
-
-        logger.info('    ' + qutils.index_to_str(id) + assembly_label)
-        # lists_of_lengths.append(fastaparser.get_lengths_from_fastafile(contigs_fpath))
-        list_of_length = []
-        number_of_Ns = 0
-        for (name, seq) in fastaparser.read_fasta(contigs_fpath):
-            assert name not in contig_length_map, f"Duplicate contig name: {name}"
-            contig_length_map[name] = len(seq)
+        logger.info('    ' + qutils.index_to_str(id) + qutils.label_from_fpath(contigs_fpath))
 
-            list_of_length.append(len(seq))
-            number_of_Ns += seq.count('N')
-            if cov_pattern.findall(name):
-                cov = int(float(cov_pattern.findall(name)[0]))
-                if len(coverage_dict[contigs_fpath]) <= cov:
-                    coverage_dict[contigs_fpath] += [0] * (cov - len(coverage_dict[contigs_fpath]) + 1)
-                coverage_dict[contigs_fpath][cov] += len(seq)
-
-        lists_of_lengths.append(list_of_length)
-        numbers_of_Ns.append(number_of_Ns)
+    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
+    names_lists, lists_of_lengths, numbers_of_Ns, coverage_lists, GC_contents = \
+        run_parallel(process_single_file, [(contigs_fpath,) for contigs_fpath in contigs_fpaths], n_jobs)
+    contig_length_map = {}
+    coverage_dict = dict(zip(contigs_fpaths, coverage_lists))
+    for names, list_of_length in zip(names_lists, lists_of_lengths):
+        for name, seq_len in zip(names, list_of_length):
+            assert name not in contig_length_map, f"Duplicate contig name: {name}"
+            contig_length_map[name] = seq_len
 
     lists_of_lengths = [sorted(list, reverse=True) for list in lists_of_lengths]
     num_contigs = max([len(list_of_length) for list_of_length in lists_of_lengths])
@@ -286,7 +322,7 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
         if reference_length:
             ng75, lg75 = N50.NG50_and_LG50(lengths_list, reference_length, 75)
         total_length = sum(lengths_list)
-        total_GC, GC_distribution, GC_contigs_distribution = GC_content(contigs_fpath, skip=qconfig.no_gc)
+        total_GC, GC_distribution, GC_contigs_distribution = GC_contents[id]
         list_of_GC_distributions.append(GC_distribution)
         list_of_GC_contigs_distributions.append(GC_contigs_distribution)
         logger.info('    ' + qutils.index_to_str(id) +
@@ -7,19 +7,23 @@
 
 from __future__ import with_statement
 
-import re
 import os, sys
+from sys import intern
+import subprocess
+from itertools import chain
 from os.path import isfile
 import datetime
 
 from quast_libs import qconfig, qutils
 from quast_libs.ca_utils.analyze_misassemblies import Mapping
-from quast_libs.ca_utils.misc import minimap_fpath, parse_cs_tag
+from quast_libs.ca_utils.cigar import iter_cigar_ops, iter_cs_ops, CS_MISMATCH, CS_INSERTION, CS_DELETION
+from quast_libs.ca_utils.misc import minimap_fpath
 
 from quast_libs.log import get_logger
 from quast_libs.qutils import md5, is_non_empty_file
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+PIPE_BUFFER_SIZE = 1024 * 1024
 
 
 class AlignerStatus:
@@ -49,10 +53,35 @@ def check_successful_check(fpath, contigs_fpath, ref_fpath):
     return True
 
 
-def run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):  # run minimap2 for AGB
+def get_minimap_agb_cmdline(ref_fpath, contigs_fpath, max_threads):
     mask_level = '1' if qconfig.min_IDY < 95 else '0.9'
-    cmdline = [minimap_fpath(), '-cx', 'asm20', '--mask-level', mask_level, '-N', '100',
-               '--score-N', '0', '-E', '1,0', '-f', '200', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
+    return [minimap_fpath(), '-cx', 'asm20', '--mask-level', mask_level, '-N', '100',
+            '--score-N', '0', '-E', '1,0', '-f', '200', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
+
+
+def get_minimap_cmdline(ref_fpath, contigs_fpath, max_threads):
+    if qconfig.is_agb_mode:
+        return get_minimap_agb_cmdline(ref_fpath, contigs_fpath, max_threads)
+
+    if qconfig.min_IDY < 90:
+        preset = 'asm20'
+    elif qconfig.min_IDY < 95 or qconfig.is_combined_ref:
+        preset = 'asm10'
+    else:
+        preset = 'asm5'
+    # -s -- min CIGAR score, -z -- affects how often to stop alignment extension, -B -- mismatch penalty
+    # -O -- gap penalty, -r -- max gap size
+    mask_level = '1' if qconfig.is_combined_ref else '0.9'
+    num_alignments = '100' if qconfig.is_combined_ref else '50'
+    additional_options = ['-B5', '-O4,16', '--no-long-join', '-r', str(qconfig.MAX_INDEL_LENGTH),
+                          '-N', num_alignments, '-s', str(qconfig.min_alignment), '-z', '200']
+    hoco_options = ["-H"]
+    return [minimap_fpath(), '-c', '-x', preset] + (additional_options if not qconfig.large_genome else []) + (hoco_options if qconfig.minimap_hoco else []) + \
+           ['--mask-level', mask_level, '--min-occ', '200', '-g', '2500', '--score-N', '2', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
+
+
+def run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):  # run minimap2 for AGB
+    cmdline = get_minimap_agb_cmdline(ref_fpath, contigs_fpath, max_threads)
     return_code = qutils.call_subprocess(cmdline, stdout=open(out_fpath, 'w'), stderr=open(log_err_fpath, 'a'),
                                          indent='  ' + qutils.index_to_str(index))
     return return_code
@@ -102,21 +131,7 @@ def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_t
 
     logger.info(f"Running minimap with\nout_fpath: {out_fpath}\nref_fpath: {ref_fpath}\ncontigs_fpath: {contigs_fpath}\nlog_err_fpath: {log_err_fpath}")
 
-    if qconfig.min_IDY < 90:
-        preset = 'asm20'
-    elif qconfig.min_IDY < 95 or qconfig.is_combined_ref:
-        preset = 'asm10'
-    else:
-        preset = 'asm5'
-    # -s -- min CIGAR score, -z -- affects how often to stop alignment extension, -B -- mismatch penalty
-    # -O -- gap penalty, -r -- max gap size
-    mask_level = '1' if qconfig.is_combined_ref else '0.9'
-    num_alignments = '100' if qconfig.is_combined_ref else '50'
-    additional_options = ['-B5', '-O4,16', '--no-long-join', '-r', str(qconfig.MAX_INDEL_LENGTH),
-                          '-N', num_alignments, '-s', str(qconfig.min_alignment), '-z', '200']
-    hoco_options = ["-H"]
-    cmdline = [minimap_fpath(), '-c', '-x', preset] + (additional_options if not qconfig.large_genome else []) + (hoco_options if qconfig.minimap_hoco else []) + \
-              ['--mask-level', mask_level, '--min-occ', '200', '-g', '2500', '--score-N', '2', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
+    cmdline = get_minimap_cmdline(ref_fpath, contigs_fpath, max_threads)
     logger.info(f"minimap cmdline: {cmdline}")
     return_code = qutils.call_subprocess(cmdline, stdout=open(out_fpath, 'w'), stderr=open(log_err_fpath, 'a'),
                                          indent='  ' + qutils.index_to_str(index))
@@ -135,6 +150,19 @@ def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_t
     return return_code
 
 
+def start_minimap(ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):
+    """
+        Starts minimap2 with its PAF output redirected into a pipe, so alignments can be parsed while minimap2 is running
+    """
+    cmdline = get_minimap_cmdline(ref_fpath, contigs_fpath, max_threads)
+    logger.info(f"minimap cmdline: {cmdline}")
+    logger.print_command_line(cmdline + ['|', '2>>', qutils.relpath(log_err_fpath)],
+                              '  ' + qutils.index_to_str(index), only_if_debug=True)
+    with open(log_err_fpath, 'a') as log_err_f:  # minimap2 keeps its own copy of the descriptor
+        return subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=log_err_f,
+                                universal_newlines=True, bufsize=PIPE_BUFFER_SIZE)
+
+
 def get_aux_out_fpaths(fname):
     coords_fpath = fname + '.coords'
     coords_filtered_fpath = fname + '.coords.filtered'
@@ -143,109 +171,155 @@ def get_aux_out_fpaths(fname):
     return coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath
 
 
-def parse_minimap_output(raw_coords_fpath, coords_fpath):
-    cigar_pattern = re.compile(r'(\d+[M=XIDNSH])')
+def parse_minimap_lines(lines):
+    """
+        Yields Mappings (with IDY as '%.2f' string, as in .coords files) for minimap2 PAF lines
+    """
+    for line in lines:
+        fs = line.split('\t')
+        if len(fs) < 10:
+            continue
+        contig, align_start, align_end, strand, ref_name, ref_start = \
+            intern(fs[0]), fs[2], fs[3], fs[4], intern(fs[5]), fs[7]
+        align_start, align_end, ref_start = map(int, (align_start, align_end, ref_start))
+        align_start += 1
+        ref_start += 1
+        if fs[-1].startswith('cs'):
+            cs = fs[-1].strip()
+            cigar = fs[-2]
+        else:
+            cs = ''
+            cigar = fs[-1]
+        cigar = cigar.split(':')[-1]
+
+        strand_direction = 1
+        if strand == '-':
+            align_start, align_end = align_end, align_start
+            strand_direction = -1
+        align_len = 0
+        ref_len = 0
+        matched_bases, bases_in_mapping = map(int, (fs[9], fs[10]))
+        for operation, n_bases in iter_cigar_ops(cigar):
+            if operation == 'S' or operation == 'H':
+                align_start += n_bases
+            elif operation == 'M' or operation == '=' or operation == 'X':
+                align_len += n_bases
+                ref_len += n_bases
+            elif operation == 'D':
+                ref_len += n_bases
+            elif operation == 'I':
+                align_len += n_bases
 
-    total_aligned_bases = 0
+        align_end = align_start + (align_len - 1) * strand_direction
+        ref_end = ref_start + ref_len - 1
+
+        idy = '%.2f' % (matched_bases * 100.0 / bases_in_mapping)
+        if ref_name != "*":
+            if float(idy) >= qconfig.min_IDY:
+                yield Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
+                              len2=align_len, idy=idy, ref=ref_name, contig=contig, cigar=cs)
+            else:
+                for align in split_align(align_start, strand_direction, ref_start, ref_name, contig, cs):
+                    yield align
+
+
+def parse_minimap_output(raw_coords_fpath, coords_fpath):
     with open(raw_coords_fpath) as f:
         with open(coords_fpath, 'w') as coords_file:
-            for line in f:
-                fs = line.split('\t')
-                if len(fs) < 10:
-                    continue
-                contig, align_start, align_end, strand, ref_name, ref_start = \
-                    fs[0], fs[2], fs[3], fs[4], fs[5], fs[7]
-                align_start, align_end, ref_start = map(int, (align_start, align_end, ref_start))
-                align_start += 1
-                ref_start += 1
-                if fs[-1].startswith('cs'):
-                    cs = fs[-1].strip()
-                    cigar = fs[-2]
-                else:
-                    cs = ''
-                    cigar = fs[-1]
-                cigar = cigar.split(':')[-1]
-
-                strand_direction = 1
-                if strand == '-':
-                    align_start, align_end = align_end, align_start
-                    strand_direction = -1
-                align_len = 0
-                ref_len = 0
-                matched_bases, bases_in_mapping = map(int, (fs[9], fs[10]))
-                operations = cigar_pattern.findall(cigar)
-
-                for op in operations:
-                    n_bases, operation = int(op[:-1]), op[-1]
-                    if operation == 'S' or operation == 'H':
-                        align_start += n_bases
-                    elif operation == 'M' or operation == '=' or operation == 'X':
-                        align_len += n_bases
-                        ref_len += n_bases
-                    elif operation == 'D':
-                        ref_len += n_bases
-                    elif operation == 'I':
-                        align_len += n_bases
-
-                align_end = align_start + (align_len - 1) * strand_direction
-                ref_end = ref_start + ref_len - 1
-                total_aligned_bases += align_len
-
-                idy = '%.2f' % (matched_bases * 100.0 / bases_in_mapping)
-                if ref_name != "*":
-                    if float(idy) >= qconfig.min_IDY:
-                        align = Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
-                                        len2=align_len, idy=idy, ref=ref_name, contig=contig, cigar=cs)
-                        coords_file.write(align.coords_str() + '\n')
-                    else:
-                        split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs)
-
-
-def split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs):
-    def _write_align():
+            for align in parse_minimap_lines(f):
+                coords_file.write(align.coords_str() + '\n')
+
+
+def split_align(align_start, strand_direction, ref_start, ref_name, contig, cs):
+    def _get_align():
         if align_len < qconfig.min_alignment or not ref_len or not align_cs:
-            return
+            return None
+        align_cigar = ''.join(align_cs)
         align_end = align_start + (align_len - 1) * strand_direction
         ref_end = ref_start + ref_len - 1
         align_idy = '%.2f' % (matched_bases * 100.0 / ref_len)
         if float(align_idy) >= qconfig.min_IDY:
-            align = Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
-                            len2=align_len, idy=align_idy, ref=ref_name, contig=contig, cigar=align_cs)
-            coords_file.write(align.coords_str() + '\n')
+            return Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
+                           len2=align_len, idy=align_idy, ref=ref_name, contig=contig, cigar=align_cigar)
+        return None
 
     ref_len, align_len, align_end = 0, 0, 0
-    align_cs = ''
+    align_cs = []  # cs operations of the current part, joined only for reported alignments
     matched_bases = 0
-    for op in parse_cs_tag(cs):
-        if op.startswith(':'):
-            n_bases = int(op[1:])
-        else:
-            n_bases = len(op) - 1
-        if op.startswith('*'):
-            align_cs += op
+    for op_type, n_bases, bases in iter_cs_ops(cs):
+        if op_type == CS_MISMATCH:
+            align_cs.append(CS_MISMATCH + bases)
             ref_len += 1
             align_len += 1
-        elif op.startswith('+'):
-            _write_align()
+        elif op_type == CS_INSERTION:
+            align = _get_align()
+            if align:
+                yield align
             align_start += (align_len + n_bases) * strand_direction
             ref_start += ref_len
             align_len, ref_len, matched_bases = 0, 0, 0
-            align_cs = ''
-        elif op.startswith('-'):
-            _write_align()
+            align_cs = []
+        elif op_type == CS_DELETION:
+            align = _get_align()
+            if align:
+                yield align
             align_start += align_len * strand_direction
             ref_start += ref_len + n_bases
             align_len, ref_len, matched_bases = 0, 0, 0
-            align_cs = ''
+            align_cs = []
         else:
-            align_cs += op
+            align_cs.append(':%d' % n_bases)
             ref_len += n_bases
             align_len += n_bases
             matched_bases += n_bases
-    _write_align()
+    align = _get_align()
+    if align:
+        yield align
+
+
+def load_coords(coords_fpath):
+    aligns = {}
+    with open(coords_fpath) as coords_file:
+        for line in coords_file:
+            mapping = Mapping.from_line(line)
+            aligns.setdefault(mapping.contig, []).append(mapping)
+    return aligns
+
+
+def _align_contigs_streaming(output_fpath, ref_fpath, contigs_fpath, index, threads, log_err_fpath, save_coords):
+    """
+        Parses minimap2 output while it is being produced. Returns status and alignments grouped by contigs
+    """
+    aligns = {}
+    minimap_proc = start_minimap(ref_fpath, contigs_fpath, log_err_fpath, index, threads)
+    first_line = minimap_proc.stdout.readline()
+    coords_file = open(output_fpath, 'w') if save_coords and first_line else None
+    for mapping in parse_minimap_lines(chain([first_line], minimap_proc.stdout)):
+        if coords_file:
+            coords_file.write(mapping.coords_str() + '\n')
+        mapping.idy = float(mapping.idy)  # as if it was read by Mapping.from_line
+        aligns.setdefault(mapping.contig, []).append(mapping)
+    minimap_proc.stdout.close()
+    return_code = minimap_proc.wait()
+    if coords_file:
+        coords_file.close()
+    if return_code != 0:
+        logger.info(f"Minimap2 returned code {return_code}")
+        if qconfig.is_agb_mode:  # same as in run_minimap: only this assembly fails in AGB mode
+            if coords_file:
+                os.remove(output_fpath)
+            return AlignerStatus.ERROR, None
+        sys.exit(f"Minimap2 returned code {return_code}")
+    if not first_line:
+        return AlignerStatus.NOT_ALIGNED, None
+    return AlignerStatus.OK, aligns
 
 
 def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads, log_out_fpath, log_err_fpath):
+    """
+        Returns aligner status and alignments grouped by contigs.
+        Alignments are None if they should be read from output_fpath (e.g. existing alignments are reused)
+    """
     log_out_f = open(log_out_fpath, 'w')
 
     successful_check_fpath = out_basename + '.sf'
@@ -260,21 +334,34 @@ def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_cont
             logger.info('  ' + qutils.index_to_str(index) + 'Using existing alignments... ')
             using_existing_alignments = True
 
-    if not using_existing_alignments:
-        log_out_f.write('\tAligning contigs to the reference\n')
-        logger.info('  ' + qutils.index_to_str(index) + 'Aligning contigs to the reference')
-
-        tmp_output_fpath = output_fpath + '_tmp'
-        exit_code = run_minimap(tmp_output_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, threads)
-        if exit_code != 0:
-            return AlignerStatus.ERROR
+    if using_existing_alignments:
+        return AlignerStatus.OK, None
 
-        if not isfile(tmp_output_fpath):
-            return AlignerStatus.FAILED
-        if not is_non_empty_file(tmp_output_fpath):
-            return AlignerStatus.NOT_ALIGNED
+    log_out_f.write('\tAligning contigs to the reference\n')
+    logger.info('  ' + qutils.index_to_str(index) + 'Aligning contigs to the reference')
 
-        create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
+    if not qconfig.minimap_hoco_wrapped:  # homopolymer decompression needs minimap2 output on disk
+        # .coords are needed for reusing alignments and for analyzing all alignments in genome_analyzer
+        save_coords = not qconfig.space_efficient or qconfig.use_all_alignments
         log_out_f.write('Filtering alignments...\n')
-        parse_minimap_output(tmp_output_fpath, output_fpath)
-    return AlignerStatus.OK
\ No newline at end of file
+        log_out_f.close()
+        status, aligns = _align_contigs_streaming(output_fpath, ref_fpath, contigs_fpath, index, threads,
+                                                  log_err_fpath, save_coords)
+        if status == AlignerStatus.OK and save_coords:
+            create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
+        return status, aligns
+
+    tmp_output_fpath = output_fpath + '_tmp'
+    exit_code = run_minimap(tmp_output_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, threads)
+    if exit_code != 0:
+        return AlignerStatus.ERROR, None
+
+    if not isfile(tmp_output_fpath):
+        return AlignerStatus.FAILED, None
+    if not is_non_empty_file(tmp_output_fpath):
+        return AlignerStatus.NOT_ALIGNED, None
+
+    create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
+    log_out_f.write('Filtering alignments...\n')
+    parse_minimap_output(tmp_output_fpath, output_fpath)
+    return AlignerStatus.OK, None
@@ -4,15 +4,16 @@
 # All Rights Reserved
 # See file LICENSE for details.
 ############################################################################
+import io
 from collections import defaultdict
 
 from quast_libs import fastaparser, qconfig
 from quast_libs.ca_utils.analyze_misassemblies import process_misassembled_contig, IndelsInfo, find_all_sv, Misassembly
 from quast_libs.ca_utils.best_set_selection import get_best_aligns_sets, get_used_indexes, score_single_align
 from quast_libs.ca_utils.misc import ref_labels_by_chromosomes
+from quast_libs.qutils import run_parallel, split_into_chunks, is_pool_process, CHUNKS_PER_THREAD
 import sys
 
-
 def add_potential_misassembly(ref, misassemblies_by_ref, refs_with_translocations, misassemblies_on_reference, local_misassemblies_on_reference, prev_align, next_align):
     cur_ref = ref_labels_by_chromosomes[ref]
     misassemblies_by_ref[cur_ref].append(Misassembly.POSSIBLE_MISASSEMBLIES)
@@ -97,10 +98,66 @@ def save_unaligned_info(sorted_aligns, contig, ctg_len, unaligned_len, unaligned
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
-def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, ref_lens,
-                    is_cyclic=None):
-    logger.info("    Enter analyze_contigs")
-    
+
+class BufferedCAOutput(object):
+    def __init__(self, field_names):
+        for name in field_names:
+            setattr(self, name, io.StringIO())
+
+
+def analyze_contigs_chunk_buffered(ca_output_fields, contigs, aligns, ref_features, ref_lens, is_cyclic,
+                                   region_struct_variations):
+    """
+        Same as analyze_contigs_chunk but all the output is kept in memory and returned as strings
+    """
+    ca_output = BufferedCAOutput(ca_output_fields)
+    unaligned_file, unaligned_info_file = io.StringIO(), io.StringIO()
+    stats = analyze_contigs_chunk(ca_output, contigs, aligns, ref_features, ref_lens, is_cyclic, region_struct_variations,
+                                  unaligned_file, unaligned_info_file)
+    outputs = dict((name, getattr(ca_output, name).getvalue()) for name in ca_output_fields)
+    return stats, outputs, unaligned_file.getvalue(), unaligned_info_file.getvalue()
+
+
+SUMMED_CHUNKS_STATS = ('unaligned', 'partially_unaligned', 'fully_unaligned_bases', 'partially_unaligned_bases',
+                       'ambiguous_contigs', 'ambiguous_contigs_extra_bases', 'ambiguous_contigs_len',
+                       'half_unaligned_with_misassembly', 'misassembly_internal_overlap', 'total_indels_info')
+# lists in the order of contigs
+CONCATENATED_CHUNKS_STATS = ('contigs_aligned_lengths', 'aligned_lengths', 'region_misassemblies', 'misassemblies_in_contigs',
+                             'misassemblies_on_reference', 'local_misassemblies_on_reference')
+# contig --> length, chunks have different contigs
+UPDATED_CHUNKS_STATS = ('misassembled_contigs', 'contig_lens')
+# reference --> list in the order of contigs
+CONCATENATED_BY_REFS_CHUNKS_STATS = ('ref_aligns', 'misassemblies_by_ref')
+
+
+def merge_chunks_stats(chunks_stats):
+    """
+        Merges results of analyze_contigs_chunk for consecutive chunks of contigs,
+        the result is the same as if all contigs were analyzed in a single chunk
+    """
+    stats = chunks_stats[0]
+    unknown_stats = set(stats) - set(SUMMED_CHUNKS_STATS + CONCATENATED_CHUNKS_STATS + UPDATED_CHUNKS_STATS +
+                                     CONCATENATED_BY_REFS_CHUNKS_STATS + ('istranslocations_by_ref',))
+    if unknown_stats:
+        raise KeyError('Do not know how to merge ' + ', '.join(sorted(unknown_stats)))
+    for chunk_stats in chunks_stats[1:]:
+        for key in SUMMED_CHUNKS_STATS:
+            stats[key] += chunk_stats[key]
+        for key in CONCATENATED_CHUNKS_STATS:
+            stats[key].extend(chunk_stats[key])
+        for key in UPDATED_CHUNKS_STATS:
+            stats[key].update(chunk_stats[key])
+        for key in CONCATENATED_BY_REFS_CHUNKS_STATS:
+            for ref, values in chunk_stats[key].items():
+                stats[key].setdefault(ref, []).extend(values)
+        for ref, counts in chunk_stats['istranslocations_by_ref'].items():  # reference --> reference --> count
+            for other_ref, count in counts.items():
+                stats['istranslocations_by_ref'][ref][other_ref] += count
+    return stats
+
+
+def analyze_contigs_chunk(ca_output, contigs, aligns, ref_features, ref_lens, is_cyclic, region_struct_variations,
+                          unaligned_file, unaligned_info_file):
     maxun = 10
     epsilon = 0.99
 
@@ -121,8 +178,6 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
     misassembled_contigs = dict()
     misassemblies_in_contigs = []
 
-    region_struct_variations = find_all_sv(qconfig.bed)
-
     istranslocations_by_ref = dict()
     misassemblies_by_ref = defaultdict(list)
     misassemblies_on_reference = []
@@ -133,11 +188,8 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
     # for counting SNPs and indels (both original (.all_snps) and corrected from local misassemblies)
     total_indels_info = IndelsInfo()
 
-    unaligned_file = open(unaligned_fpath, 'w')
-    unaligned_info_file = open(unaligned_info_fpath, 'w')
-    unaligned_info_file.write('\t'.join(['Contig', 'Total_length', 'Unaligned_length', 'Unaligned_type', 'Unaligned_parts']) + '\n')
     contig_lens = {}
-    for contig, seq in fastaparser.read_fasta(contigs_fpath):
+    for contig, seq in contigs:
         #logger.info("      Processing contig " + str(contig) + " (len " + str(len(seq)) + ")")
         original_aligned_lengths = aligned_lengths.copy()
 
@@ -407,8 +459,71 @@ def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fp
         ca_output.icarus_out_f.write('\t'.join(['CONTIG', contig, str(ctg_len), contig_type]) + '\n')
         ca_output.stdout_f.write('\n')
 
+    return {'unaligned': unaligned, 'partially_unaligned': partially_unaligned,
+            'fully_unaligned_bases': fully_unaligned_bases, 'partially_unaligned_bases': partially_unaligned_bases,
+            'ambiguous_contigs': ambiguous_contigs, 'ambiguous_contigs_extra_bases': ambiguous_contigs_extra_bases,
+            'ambiguous_contigs_len': ambiguous_contigs_len,
+            'half_unaligned_with_misassembly': half_unaligned_with_misassembly,
+            'misassembly_internal_overlap': misassembly_internal_overlap,
+            'ref_aligns': ref_aligns, 'contigs_aligned_lengths': contigs_aligned_lengths,
+            'aligned_lengths': aligned_lengths, 'region_misassemblies': region_misassemblies,
+            'misassembled_contigs': misassembled_contigs, 'misassemblies_in_contigs': misassemblies_in_contigs,
+            'istranslocations_by_ref': istranslocations_by_ref, 'misassemblies_by_ref': misassemblies_by_ref,
+            'misassemblies_on_reference': misassemblies_on_reference,
+            'local_misassemblies_on_reference': local_misassemblies_on_reference,
+            'total_indels_info': total_indels_info, 'contig_lens': contig_lens}
+
+
+def analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, ref_lens,
+                    is_cyclic=None, threads=1):
+    logger.info("    Enter analyze_contigs")
+
+    region_struct_variations = find_all_sv(qconfig.bed)
+
+    unaligned_file = open(unaligned_fpath, 'w')
+    unaligned_info_file = open(unaligned_info_fpath, 'w')
+    unaligned_info_file.write('\t'.join(['Contig', 'Total_length', 'Unaligned_length', 'Unaligned_type', 'Unaligned_parts']) + '\n')
+    # only lengths of contigs and slices between alignments are needed, so the sequences are read lazily if possible
+    contigs = fastaparser.read_fasta_lazily(contigs_fpath)
+    chunks = None
+    if threads > 1 and not is_pool_process():
+        contigs = list(contigs)
+        if len(contigs) > 1:
+            # consecutive chunks of approximately the same total length
+            chunks = split_into_chunks(contigs, min(len(contigs), threads * CHUNKS_PER_THREAD),
+                                       size=lambda contig: len(contig[1]))
+    if chunks and len(chunks) > 1:
+        # contigs are analyzed independently, so consecutive chunks are processed in parallel
+        # and the output is concatenated in the original order
+        ca_output_fields = [name for name, handler in vars(ca_output).items() if handler is not None]
+        parallel_args = [(ca_output_fields, chunk, dict((contig, aligns[contig]) for contig, _ in chunk if contig in aligns),
+                          ref_features, ref_lens, is_cyclic, region_struct_variations) for chunk in chunks]
+        chunks_stats, chunks_outputs, chunks_unaligned, chunks_unaligned_info = \
+            run_parallel(analyze_contigs_chunk_buffered, parallel_args, min(threads, len(chunks)))
+        for outputs, unaligned, unaligned_info in zip(chunks_outputs, chunks_unaligned, chunks_unaligned_info):
+            for name, output in outputs.items():
+                getattr(ca_output, name).write(output)
+            unaligned_file.write(unaligned)
+            unaligned_info_file.write(unaligned_info)
+        stats = merge_chunks_stats(chunks_stats)
+    else:
+        stats = analyze_contigs_chunk(ca_output, contigs, aligns, ref_features, ref_lens, is_cyclic,
+                                      region_struct_variations, unaligned_file, unaligned_info_file)
     unaligned_file.close()
     unaligned_info_file.close()
+
+    unaligned, partially_unaligned, fully_unaligned_bases, partially_unaligned_bases, ambiguous_contigs, \
+        ambiguous_contigs_extra_bases, ambiguous_contigs_len, half_unaligned_with_misassembly, misassembly_internal_overlap = \
+        [stats[key] for key in ('unaligned', 'partially_unaligned', 'fully_unaligned_bases', 'partially_unaligned_bases',
+                                'ambiguous_contigs', 'ambiguous_contigs_extra_bases', 'ambiguous_contigs_len',
+                                'half_unaligned_with_misassembly', 'misassembly_internal_overlap')]
+    ref_aligns, contigs_aligned_lengths, aligned_lengths, region_misassemblies, misassembled_contigs, \
+        misassemblies_in_contigs, istranslocations_by_ref, misassemblies_by_ref, misassemblies_on_reference, \
+        local_misassemblies_on_reference, total_indels_info, contig_lens = \
+        [stats[key] for key in ('ref_aligns', 'contigs_aligned_lengths', 'aligned_lengths', 'region_misassemblies',
+                                'misassembled_contigs', 'misassemblies_in_contigs', 'istranslocations_by_ref',
+                                'misassemblies_by_ref', 'misassemblies_on_reference', 'local_misassemblies_on_reference',
+                                'total_indels_info', 'contig_lens')]
     misassembled_bases = sum(misassembled_contigs.values())
 
     # special case: --skip-unaligned-mis-contigs is specified
@@ -7,9 +7,11 @@
 
 from __future__ import with_statement
 from __future__ import division
+from sys import intern
 
 from quast_libs import qconfig
-from quast_libs.ca_utils.misc import is_same_reference, get_ref_by_chromosome, parse_cs_tag
+from quast_libs.ca_utils.cigar import parse_cs_tag
+from quast_libs.ca_utils.misc import is_same_reference, get_ref_by_chromosome
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
@@ -48,6 +50,10 @@ class StructuralVariations(object):
 
 class Mapping(object):
     # 1 is ref, 2 is contig
+    # there may be millions of alignments (e.g. of repetitive contigs), so instances do not have __dict__
+    __slots__ = ('s1', 'e1', 's2', 'e2', 'len1', 'len2', 'idy', 'ref', 'contig', 'cigar', 'ns_pos', 'sv_type',
+                 'len2_excluding_local_misassemblies', 'len2_including_local_misassemblies')
+
     def __init__(self, s1, e1, s2=None, e2=None, len1=None, len2=None, idy=None, ref=None, contig=None, cigar=None, ns_pos=None, sv_type=None, len2_excluding_local_misassemblies=None, len2_including_local_misassemblies=None):
         self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig = s1, e1, s2, e2, len1, len2, idy, ref, contig
         self.cigar = cigar
@@ -62,8 +68,8 @@ class Mapping(object):
         # 4324128  4496883  |   112426   285180  |   172755   172756  |  99.9900  | gi|48994873|gb|U00096.2|	NODE_333_length_285180_cov_221082
         line = line.split()
         assert line[2] == line[5] == line[8] == line[10] == '|', line
-        ref = line[11]
-        contig = line[12]
+        ref = intern(line[11])
+        contig = intern(line[12])
         s1, e1, s2, e2, len1, len2 = [int(line[i]) for i in [0, 1, 3, 4, 6, 7]]
         idy = float(line[9])
         cigar = line[-1]
@@ -98,12 +104,6 @@ class Mapping(object):
         """Returns True for positive strand and False for negative"""
         return self.s2 < self.e2
 
-    def len2_excluding_local_misassemblies(self):
-        return self.len2_excluding_local_misassemblies if self.len2_excluding_local_misassemblies is not None else self.len2
-
-    def len2_including_local_misassemblies(self):
-        return self.len2_including_local_misassemblies if self.len2_including_local_misassemblies is not None else self.len2
-
 
 class IndelsInfo(object):
     def __init__(self):
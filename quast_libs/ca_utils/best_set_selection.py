@@ -5,7 +5,9 @@
 # See file LICENSE for details.
 ############################################################################
 
+from bisect import bisect_left, insort
 from heapq import heappush, heappop
+from itertools import chain, islice
 try:
    from collections import OrderedDict
 except ImportError:
@@ -17,10 +19,23 @@ from quast_libs.ca_utils.misc import is_same_reference
 
 
 class ScoredSet(object):
-    def __init__(self, score, indexes, uncovered):
+    def __init__(self, score, indexes, uncovered, last_aligns=()):
         self.score = score
         self.indexes = indexes
         self.uncovered = uncovered
+        # (at most) two last alignments of the set with the internal overlap between them excluded,
+        # so extending the set does not require cloning all its alignments. They should not be modified
+        self.last_aligns = last_aligns
+
+    def extend(self, score, idx, uncovered, sorted_aligns):
+        align = sorted_aligns[idx]
+        if self.indexes:
+            prev_align, align = sorted_aligns[self.indexes[-1]].clone(), align.clone()
+            exclude_internal_overlaps(prev_align, align)
+            last_aligns = (prev_align, align)
+        else:
+            last_aligns = (align,)
+        return ScoredSet(score, self.indexes + [idx], uncovered, last_aligns)
 
 
 class PutativeBestSet(object):
@@ -175,6 +190,8 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
     # Stage 1: Dynamic programming for finding the best score
     stdout_f.write('\t\t\tLooking for the best set of alignments (out of %d total alignments)\n' % len(sorted_aligns))
     all_scored_sets = [ScoredSet(0, [], ctg_len)]
+    last_indexes = [-1]  # last alignment index of each scored set (increasing)
+    scored_sets_order = [(0, 0)]  # (score, position in all_scored_sets) sorted by score
     max_score = 0
 
     cur_solid_idx = -1
@@ -182,23 +199,36 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
     solids = sorted(solids, key=lambda x: (x.end(), x.len2), reverse=True)
     for idx, align in enumerate(sorted_aligns):
         local_max_score = 0
-        new_scored_set = None
+        best_predecessor = None
         if solids and align == solids[-1]:
             next_solid_idx = idx
             del solids[-1]
-        for scored_set in reversed(all_scored_sets):
-            if scored_set.indexes and scored_set.indexes[-1] < cur_solid_idx:
+        # sets finishing before the last solid alignment could not be extended (the empty set too unless it is the only one)
+        first_allowed_pos = bisect_left(last_indexes, cur_solid_idx)
+        if first_allowed_pos == 1:
+            first_allowed_pos = 0
+        # extending a set can not increase its score by more than the score of the new alignment,
+        # so the sets are checked from the best one and the worse ones are skipped.
+        # The result is the same as of checking all sets from the last one (ties are resolved in favor of the last set)
+        max_added_score = score_single_align(align)
+        for set_score, pos in reversed(scored_sets_order):
+            if set_score + max_added_score < local_max_score:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
-            score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
-                                         seq, region_struct_variations, penalties)
+            if pos < first_allowed_pos:
+                continue
+            scored_set = all_scored_sets[pos]
+            score, uncovered = get_score(scored_set, align, sorted_aligns, ref_lens, is_cyclic, seq,
+                                         region_struct_variations, penalties)
             if score is None:  # incorrect set, i.e. internal overlap excluding resulted in incorrectly short alignment
                 continue
-            if score > local_max_score:
+            if score > local_max_score or (score == local_max_score and best_predecessor and pos > best_predecessor[0]):
                 local_max_score = score
-                new_scored_set = ScoredSet(score, scored_set.indexes + [idx], uncovered)
-        if new_scored_set:
-            all_scored_sets.append(new_scored_set)
+                best_predecessor = (pos, uncovered)
+        if best_predecessor:
+            pos, uncovered = best_predecessor
+            insort(scored_sets_order, (local_max_score, len(all_scored_sets)))
+            all_scored_sets.append(all_scored_sets[pos].extend(local_max_score, idx, uncovered, sorted_aligns))
+            last_indexes.append(idx)
             if local_max_score > max_score:
                 max_score = local_max_score
         if next_solid_idx != cur_solid_idx:
@@ -252,9 +282,8 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
             # we can enlarge the set with "earlier" alignments only
             if scored_set.indexes and scored_set.indexes[-1] >= putative_set.indexes[0]:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
-            score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
-                                         seq, region_struct_variations, penalties)
+            score, uncovered = get_score(scored_set, align, sorted_aligns, ref_lens, is_cyclic, seq,
+                                         region_struct_variations, penalties)
             if score is not None:
                 putative_predecessors[scored_set] = (score, uncovered)
                 if score > local_max_score:
@@ -278,36 +307,38 @@ def get_used_indexes(best_sets):
     return set([index for best_set in best_sets for index in best_set.indexes])
 
 
-def get_added_len(set_aligns, cur_align):
-    last_align_idx = -2
-    last_align = set_aligns[last_align_idx]
+def get_added_len(preceding_aligns, cur_align):
+    # preceding_aligns are the alignments of the set starting from the last one (going to the contig start)
+    preceding_aligns = iter(preceding_aligns)
+    last_align = next(preceding_aligns)
     added_right = cur_align.end() - max(cur_align.start() - 1, last_align.end())
     added_left = 0
     while cur_align.start() < last_align.start():
         added_left += last_align.start() - cur_align.start()
-        last_align_idx -= 1
-        if -last_align_idx <= len(set_aligns):
-            prev_start = last_align.start()  # in case of overlapping of old and new last_align
-            last_align = set_aligns[last_align_idx]
-            added_left -= max(0, min(prev_start, last_align.end()) - cur_align.start() + 1)
-        else:
+        prev_start = last_align.start()  # in case of overlapping of old and new last_align
+        last_align = next(preceding_aligns, None)
+        if last_align is None:
             break
+        added_left -= max(0, min(prev_start, last_align.end()) - cur_align.start() + 1)
     return added_right + added_left
 
 
-def get_score(score, aligns, ref_lens, is_cyclic, uncovered_len, seq, region_struct_variations, penalties):
-    if len(aligns) > 1:
-        align1, align2 = aligns[-2], aligns[-1]
-        is_fake_translocation = is_fragmented_ref_fake_translocation(align1, align2, ref_lens)
-        overlaped_len = max(0, align1.end() - align2.start() + 1)
-        if len(aligns) > 2:  # does not affect score and uncovered but it is important for further checking on set correctness
-            exclude_internal_overlaps(aligns[-3], align1)
+def get_score(scored_set, align, sorted_aligns, ref_lens, is_cyclic, seq, region_struct_variations, penalties):
+    score, uncovered_len = scored_set.score, scored_set.uncovered
+    if scored_set.indexes:
+        prev_align = sorted_aligns[scored_set.indexes[-1]]
+        is_fake_translocation = is_fragmented_ref_fake_translocation(prev_align, align, ref_lens)
+        overlaped_len = max(0, prev_align.end() - align.start() + 1)
+        # the overlap with the previous alignment of the set is already excluded from the set last alignment
+        # (it does not affect score and uncovered but it is important for further checking on set correctness)
+        align1, align2 = scored_set.last_aligns[-1].clone(), align.clone()
         reduced_len, _ = exclude_internal_overlaps(align1, align2)  # reduced_len is for align1 only
         # check whether the set is still correct, i.e both alignments are rather large
         if min(align1.len2, align2.len2) < qconfig.min_alignment:
             return None, None
 
-        added_len = get_added_len(aligns, aligns[-1])
+        earlier_aligns = (sorted_aligns[i] for i in islice(reversed(scored_set.indexes), 2, None))
+        added_len = get_added_len(chain([align1], scored_set.last_aligns[-2::-1], earlier_aligns), align2)
         uncovered_len -= (added_len - reduced_len)
         score += score_single_align(align2, ctg_len=added_len) - score_single_align(align1, ctg_len=reduced_len)
         is_extensive_misassembly, aux_data = is_misassembly(align1, align2, seq, ref_lens, is_cyclic, region_struct_variations,
@@ -336,8 +367,8 @@ def get_score(score, aligns, ref_lens, is_cyclic, uncovered_len, seq, region_str
         overlap_penalty = min(overlaped_len * penalties['overlap_multiplier'], misassembly_penalty)
         score -= (misassembly_penalty + overlap_penalty)
     else:
-        score += score_single_align(aligns[-1])
-        uncovered_len -= aligns[-1].len2
+        score += score_single_align(align)
+        uncovered_len -= align.len2
     return score, uncovered_len
 
 
@@ -0,0 +1,73 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# This is auxiliary file for contigs_analyzer.py
+# Parsing of minimap2 CIGAR strings and cs tags (short form, e.g. cs:Z::10*ag:5+tt:3-c:7)
+#
+############################################################################
+
+from __future__ import with_statement
+import re
+
+CS_MATCH = ':'
+CS_MISMATCH = '*'
+CS_INSERTION = '+'
+CS_DELETION = '-'
+
+cs_pattern = re.compile(r':(\d+)|\*([acgtn]+)|\-([acgtn]+)|\+([acgtn]+)')
+_cs_mismatch_pattern = re.compile(r'\*[acgt][acgt]')  # mismatches involving Ns are not counted
+_cs_indel_pattern = re.compile(r'[+\-][acgtn]+')
+cigar_pattern = re.compile(r'(\d+)([M=XIDNSH])')
+
+
+def parse_cs_tag(cs):
+    """
+        Returns cs operations as strings, e.g. [':10', '*ag', ':5', '+tt']
+    """
+    return [match.group(0) for match in cs_pattern.finditer(cs)]
+
+
+def iter_cs_ops(cs):
+    """
+        Yields (op_type, length, bases) for cs operations.
+        Bases are None for matches, ref and contig nucleotides for mismatches and inserted/deleted bases for indels
+    """
+    for match in cs_pattern.finditer(cs):
+        group = match.lastindex
+        if group == 1:
+            yield CS_MATCH, int(match.group(1)), None
+        elif group == 2:
+            yield CS_MISMATCH, 1, match.group(2)
+        else:
+            bases = match.group(group)
+            yield CS_DELETION if group == 3 else CS_INSERTION, len(bases), bases
+
+
+def count_cs_ops(cs):
+    """
+        Fast path for when positions of SNPs and indels are not needed.
+        Returns number of mismatches (not involving Ns), inserted bases, deleted bases, and lengths of indels
+    """
+    mismatches = len(_cs_mismatch_pattern.findall(cs))
+    insertions, deletions = 0, 0
+    indels_list = []
+    for indel in _cs_indel_pattern.findall(cs):
+        n_bases = len(indel) - 1
+        indels_list.append(n_bases)
+        if indel[0] == CS_INSERTION:
+            insertions += n_bases
+        else:
+            deletions += n_bases
+    return mismatches, insertions, deletions, indels_list
+
+
+def iter_cigar_ops(cigar):
+    """
+        Yields (operation, length) for CIGAR string operations
+    """
+    for n_bases, operation in cigar_pattern.findall(cigar):
+        yield operation, int(n_bases)
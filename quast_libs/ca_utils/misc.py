@@ -12,7 +12,6 @@
 from __future__ import with_statement
 import gzip
 import os
-import re
 from itertools import repeat
 from os.path import isdir, join, basename
 
@@ -22,6 +21,7 @@ except ImportError:
    from quast_libs.site_packages.ordered_dict import OrderedDict
 
 from quast_libs import qconfig
+from quast_libs.parallel_gzip import open_gzip
 from quast_libs.qutils import compile_tool, val_to_str, get_path_to_program
 
 contig_aligner_dirpath = join(qconfig.LIBS_LOCATION, 'minimap2')
@@ -60,11 +60,6 @@ def get_ref_by_chromosome(chrom):
     return ref_labels_by_chromosomes[chrom] if chrom in ref_labels_by_chromosomes else ''
 
 
-def parse_cs_tag(cigar):
-    cs_pattern = re.compile(r':\d+|\*[acgtn]+|\-[acgtn]+|\+[acgtn]+')
-    return cs_pattern.findall(cigar)
-
-
 def print_file(all_rows, fpath, append_to_existing_file=False):
     colwidths = repeat(0)
     for row in all_rows:
@@ -115,7 +110,7 @@ def open_gzipsafe(f, mode='rt'):
                     return open(f, mode=mode)
                 else:
                     h.close()
-                    h = gzip.open(f, mode=mode)
+                    h = open_gzip(f, mode=mode)
                     return h
     else:
         return open(f, mode=mode)
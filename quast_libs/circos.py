@@ -18,10 +18,10 @@ try:
 except ImportError:
    from quast_libs.site_packages.ordered_dict import OrderedDict
 
-from quast_libs import qutils, qconfig
+from quast_libs import qutils, qconfig, reference_profile
 from quast_libs.ca_utils.align_contigs import get_aux_out_fpaths
-from quast_libs.ca_utils.misc import create_minimap_output_dir, parse_cs_tag
-from quast_libs.fastaparser import get_chr_lengths_from_fastafile
+from quast_libs.ca_utils.cigar import iter_cs_ops, CS_MISMATCH, CS_INSERTION
+from quast_libs.ca_utils.misc import create_minimap_output_dir
 from quast_libs.icarus_utils import get_assemblies, check_misassembled_blocks, Alignment
 from quast_libs.qutils import get_path_to_program, is_non_empty_file, relpath
 from quast_libs.reads_analyzer import COVERAGE_FACTOR
@@ -31,6 +31,8 @@ TRACK_WIDTH = 0.04
 TRACK_INTERVAL = 0.04
 BIG_TRACK_INTERVAL = 0.06
 MAX_POINTS = 50000
+WINDOW_SIZES = [(5 * 10 ** 8, 20000), (3 * 10 ** 8, 10000), (10 ** 8, 5000), (10 ** 6, 1000)]  # (reference length, GC window size)
+DEFAULT_WINDOW_SIZE = 100
 
 
 def create_ideogram(chr_lengths, output_dir):
@@ -282,12 +284,11 @@ def create_mismatches_plot(assembly, window_size, ref_len, root_dir, output_dir)
             chrom = line.split()[11].strip()
             cigar = line.split()[-1].strip()
             ref_pos = s1
-            for op in parse_cs_tag(cigar):
-                n_bases = len(op) - 1
-                if op.startswith('*'):
+            for op_type, n_bases, _ in iter_cs_ops(cigar):
+                if op_type == CS_MISMATCH:
                     mismatch_density_by_chrom[chrom][int(ref_pos) // window_size] += 1
                     ref_pos += 1
-                elif not op.startswith('+'):
+                elif op_type != CS_INSERTION:
                     ref_pos += n_bases
     with open(mismatches_fpath, 'w') as out_f:
         for chrom, density_list in mismatch_density_by_chrom.items():
@@ -383,17 +384,10 @@ def create_labels(chr_lengths, assemblies, features_containers, coverage_fpath,
 
 
 def set_window_size(ref_len):
-    if ref_len > 5 * 10 ** 8:
-        window_size = 20000
-    elif ref_len > 3 * 10 ** 8:
-        window_size = 10000
-    elif ref_len > 10 ** 8:
-        window_size = 5000
-    elif ref_len > 10 ** 6:
-        window_size = 1000
-    else:
-        window_size = 100
-    return window_size
+    for min_ref_len, window_size in WINDOW_SIZES:
+        if ref_len > min_ref_len:
+            return window_size
+    return DEFAULT_WINDOW_SIZE
 
 
 def create_legend(assemblies, min_gc, max_gc, features_containers, coverage_fpath, output_dir):
@@ -420,7 +414,7 @@ def create_conf(ref_fpath, contigs_fpaths, contig_report_fpath_pattern, output_d
     if not exists(data_dir):
         os.makedirs(data_dir)
 
-    chr_lengths = get_chr_lengths_from_fastafile(ref_fpath)
+    chr_lengths = reference_profile.get(ref_fpath).chr_lengths
     max_len, karyotype_fpath, ideogram_fpath = create_ideogram(chr_lengths, data_dir)
     if max_len >= 10 ** 6:
         chrom_units = 10 ** 5
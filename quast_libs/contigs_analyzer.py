@@ -17,26 +17,28 @@
 ############################################################################
 
 from __future__ import with_statement
+import io
 import os
 import sys
 import re
 from collections import defaultdict
+from heapq import heappush, heappop
 from os.path import join, dirname
 
-from quast_libs import reporting, qconfig, qutils, fastaparser, N50
+from quast_libs import reporting, qconfig, qutils, fastaparser, N50, reference_profile
 from quast_libs.ca_utils import misc
 from quast_libs.ca_utils.analyze_contigs import analyze_contigs
-from quast_libs.ca_utils.analyze_misassemblies import Mapping, IndelsInfo
+from quast_libs.ca_utils.analyze_misassemblies import IndelsInfo
+from quast_libs.ca_utils.cigar import iter_cs_ops, count_cs_ops, CS_MISMATCH, CS_INSERTION, CS_DELETION
 from quast_libs.ca_utils.misc import ref_labels_by_chromosomes, compile_aligner, \
-    create_minimap_output_dir, close_handlers, parse_cs_tag
+    create_minimap_output_dir, close_handlers
 
-from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, AlignerStatus
+from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, load_coords, AlignerStatus
 from quast_libs.ca_utils.save_results import print_results, save_result, save_result_for_unaligned, \
     save_combined_ref_stats
-from quast_libs.fastaparser import get_genome_stats
 
 from quast_libs.log import get_logger
-from quast_libs.qutils import is_python2, run_parallel
+from quast_libs.qutils import is_python2, run_parallel, split_into_chunks, is_pool_process, CHUNKS_PER_THREAD
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
@@ -49,151 +51,196 @@ class CAOutput():
         self.used_snps_f = used_snps_f
         self.icarus_out_f = icarus_out_f
 
-from pprint import pprint
-
-def filter_count(list, filter):
-    count = 0
-    for item in list:
-        if filter(item):
-            count += 1
-    return count
-
-def P(list, minimum):
-    print("      Computing P{}".format(minimum))
-    return filter_count(list, lambda x: x >= minimum) / len(list)
-
-def analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath, contig_length_map=None):
+def _add_coverage_runs(intervals, ns_intervals, histograms):
+    """
+        Sweep line over alignment intervals of a single chromosome.
+        intervals: list of (start, end, align_size, strict_align_size, contig_length), end is exclusive
+        ns_intervals: sorted non-overlapping list of (start, end) runs of Ns, end is exclusive
+        For every maximal run of bases with the same maximum values, adds its length to histograms
+        (one per value: {maximum value: number of bases}).
+        Returns the number of covered bases (excluding Ns)
+    """
+    boundaries = set()
+    for interval in intervals:
+        boundaries.add(interval[0])
+        boundaries.add(interval[1])
+    for ns_start, ns_end in ns_intervals:
+        boundaries.add(ns_start)
+        boundaries.add(ns_end)
+    boundaries = sorted(boundaries)
+    intervals.sort()
+
+    # max-heaps of (-value, end) with lazy removal of finished alignments
+    heaps = tuple([] for _ in histograms)
+    next_interval = 0
+    next_ns = 0
+    covered_bases = 0
+    for left, right in zip(boundaries, boundaries[1:]):
+        while next_interval < len(intervals) and intervals[next_interval][0] <= left:
+            end = intervals[next_interval][1]
+            for heap, value in zip(heaps, intervals[next_interval][2:]):
+                heappush(heap, (-value, end))
+            next_interval += 1
+        for heap in heaps:
+            while heap and heap[0][1] <= left:
+                heappop(heap)
+        if not heaps[0]:
+            continue
+        while next_ns < len(ns_intervals) and ns_intervals[next_ns][1] <= left:
+            next_ns += 1
+        if next_ns < len(ns_intervals) and ns_intervals[next_ns][0] <= left:
+            continue
+        run_length = right - left
+        covered_bases += run_length
+        for heap, histogram in zip(heaps, histograms):
+            histogram[-heap[0][0]] += run_length
+    return covered_bases
+
+
+def _write_used_snps(align, chr_name, used_snps_f, indels_info):
+    # Vars with 1 are on the reference, vars with 2 are on the contig
+    ref_pos, ctg_pos = align.s1, align.s2
+    strand_direction = 1 if align.s2 < align.e2 else -1
+    for op_type, n_bases, bases in iter_cs_ops(align.cigar):
+        if op_type == CS_MISMATCH:
+            ref_nucl, ctg_nucl = bases[0].upper(), bases[1].upper()
+            if ctg_nucl != 'N' and ref_nucl != 'N':
+                indels_info.mismatches += 1
+                used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
+            ref_pos += 1
+            ctg_pos += 1 * strand_direction
+        elif op_type == CS_INSERTION:
+            indels_info.indels_list.append(n_bases)
+            indels_info.insertions += n_bases
+            if n_bases < qconfig.MAX_INDEL_LENGTH:
+                used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, '.', bases.upper(), ctg_pos))
+            ctg_pos += n_bases * strand_direction
+        elif op_type == CS_DELETION:
+            indels_info.indels_list.append(n_bases)
+            indels_info.deletions += n_bases
+            if n_bases < qconfig.MAX_INDEL_LENGTH:
+                used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, bases.upper(), '.', ctg_pos))
+            ref_pos += n_bases
+        else:
+            ref_pos += n_bases
+            ctg_pos += n_bases * strand_direction
+
+
+def analyze_coverage_shard(chr_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_f, contig_length_map=None):
+    """
+        Coverage of a group of reference chromosomes: chr_aligns is a list of (chr_name, aligns).
+        Returns mergeable partial results: covered bases, indels info, total length of alignments
+        and histograms of per-base EA, strict EA and E maxima ({maximum value: number of bases})
+    """
+    indels_info = IndelsInfo()
+    alignment_total_length = 0
+    covered_bases = 0
+    histograms = (defaultdict(int), defaultdict(int), defaultdict(int))
+    for chr_name, aligns in chr_aligns:
+        intervals = []
+        # alignments cover [s1, e1) or, if they go through the end of a circular chromosome, [s1, end] and [1, e1)
+        chr_end = reference_chromosomes[chr_name] + 1
+        for align in aligns:
+            if qconfig.show_snps:
+                _write_used_snps(align, chr_name, used_snps_f, indels_info)
+            else:
+                mismatches, insertions, deletions, indels_list = count_cs_ops(align.cigar)
+                indels_info.mismatches += mismatches
+                indels_info.insertions += insertions
+                indels_info.deletions += deletions
+                indels_info.indels_list += indels_list
+
+            alignment_total_length += align.len2_excluding_local_misassemblies
+            align_size = align.len2_excluding_local_misassemblies # Use the same len that is used to compute NGAx
+            strict_align_size = align.len2_including_local_misassemblies # Use the same len that is used to strict compute NGAx
+            if contig_length_map is not None:
+                contig_length = contig_length_map[align.contig]
+            else:
+                contig_length = 0
+
+            if align.s1 < align.e1:
+                ranges = [(align.s1, min(align.e1, chr_end))]
+            else:
+                ranges = [(align.s1, chr_end), (1, min(align.e1, chr_end))]
+            for start, end in ranges:
+                assert start >= 0
+                if start < end:
+                    intervals.append((start, end, align_size, strict_align_size, contig_length))
+        if intervals:
+            covered_bases += _add_coverage_runs(intervals, ns_by_chromosomes[chr_name], histograms)
+    return covered_bases, indels_info, alignment_total_length, tuple(dict(histogram) for histogram in histograms)
+
+
+def analyze_coverage_shard_buffered(chr_aligns, reference_chromosomes, ns_by_chromosomes, contig_length_map=None):
+    """
+        Same as analyze_coverage_shard but the used SNPs are kept in memory and returned as a string
+    """
+    used_snps_f = io.StringIO()
+    partial = analyze_coverage_shard(chr_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_f, contig_length_map)
+    return partial + (used_snps_f.getvalue(),)
+
+
+def analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath, contig_length_map=None,
+                     threads=1):
     logger.info("    Enter analyze_coverage")
     #logger.info(f"    {ref_aligns=}")
-    indels_info = IndelsInfo()
-    maximum_contig_align_size_per_ref_base = {}
-    strict_maximum_contig_align_size_per_ref_base = {}
-    maximum_contig_length_per_ref_base = {}
-    genome_mapping = {}
     genome_length = 0
+    # per-base arrays used to have an unused 0th position, it still counts in the percentiles
+    total_length = 0
     for chr_name, chr_len in reference_chromosomes.items():
         logger.info(f"      Chromosome {chr_name} has length {chr_len}")
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
-        maximum_contig_align_size_per_ref_base[chr_name] = [0] * (chr_len + 1)
-        strict_maximum_contig_align_size_per_ref_base[chr_name] = [0] * (chr_len + 1)
-        maximum_contig_length_per_ref_base[chr_name] = [0] * (chr_len + 1)
         genome_length += chr_len
+        total_length += chr_len + 1
     logger.info("      Genome length: " + str(genome_length))
 
-    alignment_total_length = 0
+    shards = None
+    if threads > 1 and len(ref_aligns) > 1 and not is_pool_process():
+        # consecutive shards with approximately the same number of alignments
+        shards = split_into_chunks(ref_aligns.items(), min(len(ref_aligns), threads * CHUNKS_PER_THREAD),
+                                   size=lambda chr_aligns: len(chr_aligns[1]))
     with open(used_snps_fpath, 'w') as used_snps_f:
-        for chr_name, aligns in ref_aligns.items():
-            for align in aligns:
-                # Vars with 1 are on the reference, vars with 2 are on the contig
-                ref_pos, ctg_pos = align.s1, align.s2
-                strand_direction = 1 if align.s2 < align.e2 else -1
-                for op in parse_cs_tag(align.cigar):
-                    if op.startswith(':'):
-                        n_bases = int(op[1:])
-                    else:
-                        n_bases = len(op) - 1
-                    if op.startswith('*'):
-                        ref_nucl, ctg_nucl = op[1].upper(), op[2].upper()
-                        if ctg_nucl != 'N' and ref_nucl != 'N':
-                            indels_info.mismatches += 1
-                            if qconfig.show_snps:
-                                used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
-                        ref_pos += 1
-                        ctg_pos += 1 * strand_direction
-                    elif op.startswith('+'):
-                        indels_info.indels_list.append(n_bases)
-                        indels_info.insertions += n_bases
-                        if qconfig.show_snps and n_bases < qconfig.MAX_INDEL_LENGTH:
-                            ref_nucl, ctg_nucl = '.', op[1:].upper()
-                            used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
-                        ctg_pos += n_bases * strand_direction
-                    elif op.startswith('-'):
-                        indels_info.indels_list.append(n_bases)
-                        indels_info.deletions += n_bases
-                        if qconfig.show_snps and n_bases < qconfig.MAX_INDEL_LENGTH:
-                            ref_nucl, ctg_nucl = op[1:].upper(), '.'
-                            used_snps_f.write('%s\t%s\t%d\t%s\t%s\t%d\n' % (chr_name, align.contig, ref_pos, ref_nucl, ctg_nucl, ctg_pos))
-                        ref_pos += n_bases
-                    else:
-                        ref_pos += n_bases
-                        ctg_pos += n_bases * strand_direction
-
-                alignment_total_length += align.len2_excluding_local_misassemblies
-                align_size = align.len2_excluding_local_misassemblies # Use the same len that is used to compute NGAx
-                strict_align_size = align.len2_including_local_misassemblies # Use the same len that is used to strict compute NGAx
+        if shards and len(shards) > 1:
+            # chromosomes are independent, so shards are processed in parallel, partial results are merged
+            # and the used SNPs are written in the original order
+            parallel_args = []
+            for shard in shards:
+                shard_contig_length_map = None
                 if contig_length_map is not None:
-                    contig_length = contig_length_map[align.contig]
-                else:
-                    contig_length = 0
-
-                if align.s1 < align.e1:
-                    for pos in range(align.s1, align.e1):
-                        assert pos >= 0
-                        if pos >= len(genome_mapping[align.ref]):
-                            continue
-                        genome_mapping[align.ref][pos] = 1
-                        maximum_contig_align_size_per_ref_base[align.ref][pos] = max(align_size, maximum_contig_align_size_per_ref_base[align.ref][pos])
-                        strict_maximum_contig_align_size_per_ref_base[align.ref][pos] = max(strict_align_size, strict_maximum_contig_align_size_per_ref_base[align.ref][pos])
-                        maximum_contig_length_per_ref_base[align.ref][pos] = max(contig_length, maximum_contig_length_per_ref_base[align.ref][pos])
-                else:
-                    for pos in range(align.s1, len(genome_mapping[align.ref])):
-                        assert pos >= 0
-                        if pos >= len(genome_mapping[align.ref]):
-                            continue
-                        genome_mapping[align.ref][pos] = 1
-                        maximum_contig_align_size_per_ref_base[align.ref][pos] = max(align_size, maximum_contig_align_size_per_ref_base[align.ref][pos])
-                        strict_maximum_contig_align_size_per_ref_base[align.ref][pos] = max(strict_align_size, strict_maximum_contig_align_size_per_ref_base[align.ref][pos])
-                        maximum_contig_length_per_ref_base[align.ref][pos] = max(contig_length, maximum_contig_length_per_ref_base[align.ref][pos])
-                    for pos in range(1, align.e1):
-                        assert pos >= 0
-                        if pos >= len(genome_mapping[align.ref]):
-                            continue
-                        genome_mapping[align.ref][pos] = 1
-                        maximum_contig_align_size_per_ref_base[align.ref][pos] = max(align_size, maximum_contig_align_size_per_ref_base[align.ref][pos])
-                        strict_maximum_contig_align_size_per_ref_base[align.ref][pos] = max(strict_align_size, strict_maximum_contig_align_size_per_ref_base[align.ref][pos])
-                        maximum_contig_length_per_ref_base[align.ref][pos] = max(contig_length, maximum_contig_length_per_ref_base[align.ref][pos])
-            for pos in ns_by_chromosomes[align.ref]:
-                genome_mapping[align.ref][pos] = 0
-                maximum_contig_align_size_per_ref_base[align.ref][pos] = 0
-                strict_maximum_contig_align_size_per_ref_base[align.ref][pos] = 0
-                maximum_contig_length_per_ref_base[align.ref][pos] = 0
-
-    covered_bases = sum([sum(genome_mapping[chrom]) for chrom in genome_mapping])
+                    shard_contig_length_map = dict((align.contig, contig_length_map[align.contig])
+                                                   for _, aligns in shard for align in aligns)
+                shard_ns_by_chromosomes = dict((chr_name, ns_by_chromosomes[chr_name]) for chr_name, _ in shard
+                                               if chr_name in ns_by_chromosomes)
+                parallel_args.append((shard, reference_chromosomes, shard_ns_by_chromosomes, shard_contig_length_map))
+            shards_covered_bases, shards_indels_info, shards_alignment_total_length, shards_histograms, shards_used_snps = \
+                run_parallel(analyze_coverage_shard_buffered, parallel_args, min(threads, len(shards)))
+            for used_snps in shards_used_snps:
+                used_snps_f.write(used_snps)
+        else:
+            covered_bases, indels_info, alignment_total_length, histograms = \
+                analyze_coverage_shard(ref_aligns.items(), reference_chromosomes, ns_by_chromosomes, used_snps_f, contig_length_map)
+            shards_covered_bases, shards_indels_info, shards_alignment_total_length, shards_histograms = \
+                [covered_bases], [indels_info], [alignment_total_length], [histograms]
+
+    covered_bases = sum(shards_covered_bases)
+    alignment_total_length = sum(shards_alignment_total_length)
+    indels_info = IndelsInfo()
+    for shard_indels_info in shards_indels_info:
+        indels_info += shard_indels_info
+    histograms = (defaultdict(int), defaultdict(int), defaultdict(int))
+    for shard_histograms in shards_histograms:
+        for histogram, shard_histogram in zip(histograms, shard_histograms):
+            for value, run_length in shard_histogram.items():
+                histogram[value] += run_length
     if covered_bases == 0:
         logger.warning(f"      Found no covered bases, setting it to one anyways to prevent division by zero.")
         covered_bases = 1
 
-    maximum_contig_align_size_per_ref_base = [align_size for contig in maximum_contig_align_size_per_ref_base.values() for align_size in contig]
-    maximum_contig_align_size_per_ref_base.sort(reverse=True)
-    ea_x_max = [0] * 101
-    for i in range(0, 100):
-        ea_x_max[i] = maximum_contig_align_size_per_ref_base[(len(maximum_contig_align_size_per_ref_base) * i) // 100]
-    ea_x_max[100] = maximum_contig_align_size_per_ref_base[-1]
-    ea_mean_max = int(sum(maximum_contig_align_size_per_ref_base) / len(maximum_contig_align_size_per_ref_base))
-    p5k = P(maximum_contig_align_size_per_ref_base, 5000)
-    p10k = P(maximum_contig_align_size_per_ref_base, 10000)
-    p15k = P(maximum_contig_align_size_per_ref_base, 15000)
-    p20k = P(maximum_contig_align_size_per_ref_base, 20000)
-
-    strict_maximum_contig_align_size_per_ref_base = [align_size for contig in strict_maximum_contig_align_size_per_ref_base.values() for align_size in contig]
-    strict_maximum_contig_align_size_per_ref_base.sort(reverse=True)
-    strict_ea_x_max = [0] * 101
-    for i in range(0, 100):
-        strict_ea_x_max[i] = strict_maximum_contig_align_size_per_ref_base[(len(strict_maximum_contig_align_size_per_ref_base) * i) // 100]
-    strict_ea_x_max[100] = strict_maximum_contig_align_size_per_ref_base[-1]
-    strict_ea_mean_max = int(sum(strict_maximum_contig_align_size_per_ref_base) / len(strict_maximum_contig_align_size_per_ref_base))
-    strict_p5k = P(strict_maximum_contig_align_size_per_ref_base, 5000)
-    strict_p10k = P(strict_maximum_contig_align_size_per_ref_base, 10000)
-    strict_p15k = P(strict_maximum_contig_align_size_per_ref_base, 15000)
-    strict_p20k = P(strict_maximum_contig_align_size_per_ref_base, 20000)
-
-    maximum_contig_length_per_ref_base = [length for contig in maximum_contig_length_per_ref_base.values() for length in contig]
-    maximum_contig_length_per_ref_base.sort(reverse=True)
-    e_x_max = [0] * 101
-    for i in range(0, 100):
-        e_x_max[i] = maximum_contig_length_per_ref_base[(len(maximum_contig_length_per_ref_base) * i) // 100]
-    e_x_max[100] = maximum_contig_length_per_ref_base[-1]
-    e_mean_max = int(sum(maximum_contig_length_per_ref_base) / len(maximum_contig_length_per_ref_base))
+    ea_histogram, strict_ea_histogram, e_histogram = histograms
+    ea_x_max, ea_mean_max, (p5k, p10k, p15k, p20k) = \
+        N50.weighted_x_max_stats(ea_histogram.items(), total_length, (5000, 10000, 15000, 20000))
+    strict_ea_x_max, strict_ea_mean_max, (strict_p5k, strict_p10k, strict_p15k, strict_p20k) = \
+        N50.weighted_x_max_stats(strict_ea_histogram.items(), total_length, (5000, 10000, 15000, 20000))
+    e_x_max, e_mean_max, _ = N50.weighted_x_max_stats(e_histogram.items(), total_length)
 
     #print("computed ea_x_max as " + str(ea_x_max))
     logger.info("      Duplication ratio = %.2f = %d/%d" % ((alignment_total_length / covered_bases), alignment_total_length, covered_bases))
@@ -246,7 +293,7 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
 
     coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath = get_aux_out_fpaths(out_basename)
     logger.info("  Aligning contigs")
-    status = align_contigs(coords_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads,
+    status, aligns = align_contigs(coords_fpath, out_basename, ref_fpath, contigs_fpath, old_contigs_fpath, index, threads,
                            log_out_fpath, log_err_fpath)
     if status != AlignerStatus.OK:
         with open(log_err_fpath, 'a') as log_err_f:
@@ -266,13 +313,10 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     log_out_f = open(log_out_fpath, 'a')
     # Loading the alignment files
     log_out_f.write('Parsing coords...\n')
-    aligns = {}
-    with open(coords_fpath) as coords_file:
+    if aligns is None:  # alignments were not streamed from the aligner
         logger.info("  Opening coords_fpath '" + str(coords_fpath) + "'")
         log_out_f.write("Opening coords_fpath '" + str(coords_fpath) + "'\n")
-        for line in coords_file:
-            mapping = Mapping.from_line(line)
-            aligns.setdefault(mapping.contig, []).append(mapping)
+        aligns = load_coords(coords_fpath)
 
     # Loading the reference sequences
     log_out_f.write('Loading reference...\n') # TODO: move up
@@ -298,7 +342,8 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
 
     log_out_f.write('Analyzing contigs...\n')
     result, ref_aligns, total_indels_info, aligned_lengths, misassembled_contigs, misassemblies_in_contigs, aligned_lengths_by_contigs =\
-        analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, reference_chromosomes, is_cyclic)
+        analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, reference_chromosomes,
+                        is_cyclic, threads)
 
     ref_aligns_lengths = [align.len2_excluding_local_misassemblies for aligns in ref_aligns.values() for align in aligns]
     ref_aligns_lengths.sort(reverse=True)
@@ -314,7 +359,8 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     if qconfig.show_snps:
         log_out_f.write('Writing SNPs into ' + used_snps_fpath + '\n')
     total_aligned_bases, indels_info, ea_x_max, strict_ea_x_max, ea_mean_max, strict_ea_mean_max, p5k, p10k, p15k, p20k, strict_p5k, strict_p10k, strict_p15k, strict_p20k, e_x_max, e_mean_max =\
-        analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath, contig_length_map)
+        analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath, contig_length_map,
+                         threads)
     total_indels_info += indels_info
     cov_stats = {
         'SNPs': total_indels_info.mismatches,
@@ -340,8 +386,9 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
 
     if not qconfig.space_efficient:
         ## outputting misassembled contigs to separate file
-        fasta = [(name, seq) for name, seq in fastaparser.read_fasta(contigs_fpath)
-                 if name in misassembled_contigs.keys()]
+        # with the .fai index only the misassembled contigs are read
+        fasta = [(name, str(seq)) for name, seq in fastaparser.read_fasta_lazily(contigs_fpath)
+                 if name in misassembled_contigs]
         fastaparser.write_fasta(join(output_dirpath, qutils.name_from_fpath(contigs_fpath) + '.mis_contigs.fa'), fasta)
 
     if qconfig.is_combined_ref:
@@ -399,7 +446,7 @@ def do(reference, contigs_fpaths, is_cyclic, output_dir, old_contigs_fpaths, bed
     n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
     threads = max(1, qconfig.max_threads // n_jobs)
 
-    genome_size, reference_chromosomes, ns_by_chromosomes = get_genome_stats(reference, skip_ns=True)
+    genome_size, reference_chromosomes, ns_by_chromosomes = reference_profile.get(reference).get_genome_stats(skip_ns=True)
     threads = qconfig.max_threads if qconfig.memory_efficient else threads
     args = [(is_cyclic, i, contigs_fpath, output_dir, reference, reference_chromosomes, ns_by_chromosomes,
             old_contigs_fpath, bed_fpath, threads, contig_length_map)
@@ -7,9 +7,11 @@
 
 from __future__ import with_statement
 import os
+import re
 import sys
-import gzip
+import mmap
 import zipfile
+from array import array
 
 try:
    from collections import OrderedDict
@@ -22,29 +24,50 @@ except ImportError:
     from quast_libs.site_packages import bz2
 if sys.version_info[0] == 3:
     import io
-from quast_libs import qconfig
+from quast_libs import qconfig, parallel_gzip
 # There is a pyfasta package -- http://pypi.python.org/pypi/pyfasta/
 # Use it!
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
+ns_pattern = re.compile('N+')
+ns_bytes_pattern = re.compile(b'N+')
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+READ_BUFFER_SIZE = 1024 * 1024
+COMPRESSED_FASTA_EXTS = ['.gz', '.gzip', '.bz2', '.bzip2', '.zip']
+WHITESPACES = b' \t\n\r\x0b\x0c'
+GC_TRANSLATION = bytes(ord('S') if c in b'GC' else c if c == ord('N') else ord('W') for c in range(256))  # for GC counting
+
 
 def _get_fasta_file_handler(fpath):
-    fasta_file = None
+    fasta_file = _get_fasta_binary_file_handler(fpath)
+    if fasta_file is not None:
+        return _read_compressed_file(fasta_file)
+
+    try:
+        fasta_file = open(fpath)
+    except IOError:
+        exc_type, exc_value, _ = sys.exc_info()
+        logger.exception(exc_value, exit_code=1)
+
+    return fasta_file
+
 
+def _get_fasta_binary_file_handler(fpath):
+    """
+        Returns binary file object with (decompressed) FASTA data or None for uncompressed files
+        (they are memory-mapped instead)
+    """
     _, ext = os.path.splitext(fpath)
 
     if not os.access(fpath, os.R_OK):
         logger.error('Permission denied accessing ' + fpath, to_stderr=True, exit_with_code=1)
 
     if ext in ['.gz', '.gzip']:
-        fasta_file = gzip.open(fpath, mode="rt")
-
+        return parallel_gzip.open_gzip(fpath, mode="rb")
     elif ext in ['.bz2', '.bzip2']:
-        fasta_file = bz2.BZ2File(fpath, mode="r")
-        fasta_file = _read_compressed_file(fasta_file)
-
+        return bz2.BZ2File(fpath, mode="r")
     elif ext in ['.zip']:
         try:
             zfile = zipfile.ZipFile(fpath, mode="r")
@@ -55,28 +78,115 @@ def _get_fasta_file_handler(fpath):
             names = zfile.namelist()
             if len(names) == 0:
                 logger.error('Reading %s: zip archive is empty' % fpath, exit_with_code=1)
-
             if len(names) > 1:
                 logger.warning('Zip archive must contain exactly one file. Using %s' % names[0])
+            return zfile.open(names[0])
+    return None
 
-            try:
-                fasta_file = zfile.open(names[0])
-                fasta_file = _read_compressed_file(fasta_file)
-            except AttributeError:
-                logger.error('Use python 2.6 or newer to work with contigs directly in zip.', exit_with_code=20)
-    else:
+
+def _read_chunks(fpath):
+    """
+        Generator of blocks of (decompressed) FASTA data in bytes.
+        Uncompressed files are memory-mapped, so blocks are read directly from the page cache
+    """
+    binary_file = _get_fasta_binary_file_handler(fpath)
+    if binary_file is not None:
+        with binary_file:
+            while True:
+                chunk = binary_file.read(READ_BLOCK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        return
+
+    with open(fpath, 'rb') as in_f:
+        file_size = os.fstat(in_f.fileno()).st_size
+        if not file_size:
+            return
+        mapped_file = mmap.mmap(in_f.fileno(), 0, access=mmap.ACCESS_READ)
         try:
-            fasta_file = open(fpath)
-        except IOError:
-            exc_type, exc_value, _ = sys.exc_info()
-            logger.exception(exc_value, exit_code=1)
+            for start in range(0, file_size, READ_BLOCK_SIZE):
+                yield mapped_file[start:start + READ_BLOCK_SIZE]
+        finally:
+            mapped_file.close()
 
-    return fasta_file
+
+def _parse_fasta_chunks(chunks, build_seqs):
+    """
+        Generator that returns FASTA entries in tuples (name, seq, length, number of Ns),
+        seq is bytes without whitespaces or None if build_seqs is False.
+        Each chunk is split by '\\n>' at once, so entries are found without scanning the chunk in Python
+    """
+    name = None
+    header = None  # beginning of a header line which continues in the next chunk
+    seq_parts = []
+    length = 0
+    ns_count = 0
+    at_line_start = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if b'\r' in chunk:
+            chunk = chunk.replace(b'\r', b'\n')  # '\r' ends lines too, same as in read_fasta
+        # the first part continues the entry from the previous chunk, each of the others is a new entry
+        parts = chunk.split(b'\n>')
+        if at_line_start and parts[0][:1] == b'>':
+            parts[0] = parts[0][1:]
+            parts.insert(0, b'')
+        last_idx = len(parts) - 1
+        for idx, part in enumerate(parts):
+            seq_start = 0
+            if idx or header is not None:
+                if idx:
+                    if name is not None:
+                        yield name, b''.join(seq_parts) if build_seqs else None, length, ns_count
+                    seq_parts = []
+                    length = 0
+                    ns_count = 0
+                    header = b''
+                line_end = part.find(b'\n')
+                if line_end == -1:
+                    if idx == last_idx:
+                        header += part
+                        break
+                    line_end = len(part)
+                name = (header + part[:line_end]).split()[0].decode()
+                header = None
+                seq_start = line_end + 1
+            seq = part[seq_start:].translate(None, WHITESPACES) if seq_start else part.translate(None, WHITESPACES)
+            length += len(seq)
+            ns_count += seq.count(b'N')
+            if build_seqs and seq:
+                seq_parts.append(seq)
+        at_line_start = chunk[-1:] == b'\n'
+    if header is not None:
+        name = header.split()[0].decode()
+    if name is not None or length:
+        yield name or '', b''.join(seq_parts) if build_seqs else None, length, ns_count
+
+
+def read_fasta_bytes(fpath):
+    """
+        Generator that returns FASTA entries in tuples (name, seq), seq is bytes.
+        Faster than read_fasta and keeps only one copy of each sequence in memory
+    """
+    for name, seq, _, _ in _parse_fasta_chunks(_read_chunks(fpath), build_seqs=True):
+        yield name, seq
+
+
+def read_fasta_stats(fpath):
+    """
+        Generator that returns tuples (name, length, number of Ns) for FASTA entries
+        without building their sequences
+    """
+    for name, _, length, ns_count in _parse_fasta_chunks(_read_chunks(fpath), build_seqs=False):
+        yield name, length, ns_count
 
 
 def _read_compressed_file(compressed_file):
     if sys.version_info[0] == 3:
-        return io.TextIOWrapper(io.BytesIO(compressed_file.read()))  # return string instead of binary data
+        # decompress incrementally while reading, return string instead of binary data
+        return io.TextIOWrapper(io.BufferedReader(compressed_file, buffer_size=READ_BUFFER_SIZE))
     return compressed_file
 
 
@@ -92,32 +202,43 @@ def get_chr_lengths_from_fastafile(fpath):
     """
         Takes filename of FASTA-file
         Returns list of lengths of sequences in FASTA-file
+        (taken from the .fai index without reading the file if the index is up to date)
     """
+    index = get_fasta_index(fpath)
+    if index is not None:
+        return index.lengths()
     chr_lengths = OrderedDict()
-    l = 0
-    chr_name = None
-    fasta_file = _get_fasta_file_handler(fpath)
-    for raw_line in fasta_file:
-        if raw_line.find('\r') != -1:
-            lines = raw_line.split('\r')
-        else:
-            lines = [raw_line]
-        for line in lines:
-            if not line:
-                continue
-            if line[0] == '>':
-                if l:  # not the first sequence in FASTA
-                    chr_lengths[chr_name] = l
-                    l = 0
-                chr_name = __get_entry_name(line)
-            else:
-                l += len(line.strip())
-
-    chr_lengths[chr_name] = l
-    fasta_file.close()
+    for chr_name, l, _ in read_fasta_stats(fpath):
+        chr_lengths[chr_name] = l
     return chr_lengths
 
 
+def get_ns_intervals(seq):
+    """
+        Takes sequence (str or bytes)
+        Returns sorted list of runs of Ns as (start, end) tuples, 1-based, end is exclusive
+    """
+    pattern = ns_bytes_pattern if isinstance(seq, bytes) else ns_pattern
+    return [(match.start() + 1, match.end() + 1) for match in pattern.finditer(seq)]
+
+
+def count_GC_in_windows(seq, window_size):
+    """
+        Takes sequence in bytes and window size
+        Returns two arrays: numbers of non-N letters and numbers of G and C letters in non-overlapping windows
+    """
+    seq = seq.translate(GC_TRANSLATION)  # one pass: G/C --> S, N stays, everything else --> W
+    seq_len = len(seq)
+    window_starts = range(0, seq_len, window_size)
+    ACGT_lens = array('L', (min(i + window_size, seq_len) - i - seq.count(b'N', i, i + window_size) for i in window_starts))
+    GC_lens = array('L', (seq.count(b'S', i, i + window_size) for i in window_starts))
+    return ACGT_lens, GC_lens
+
+
+def get_ns_count(ns_intervals):
+    return sum(end - start for start, end in ns_intervals)
+
+
 def get_genome_stats(fasta_fpath, skip_ns=False):
     genome_size = 0
     reference_chromosomes = {}
@@ -126,48 +247,190 @@ def get_genome_stats(fasta_fpath, skip_ns=False):
         chr_name = name.split()[0]
         chr_len = len(seq)
         genome_size += chr_len
-        ns_by_chromosomes[chr_name] = set(x + 1 for x, s in enumerate(seq) if s == 'N')
+        ns_by_chromosomes[chr_name] = get_ns_intervals(seq)
         if skip_ns:
-            genome_size -= len(ns_by_chromosomes[chr_name])
+            genome_size -= get_ns_count(ns_by_chromosomes[chr_name])
         reference_chromosomes[chr_name] = chr_len
     return genome_size, reference_chromosomes, ns_by_chromosomes
 
 
 def create_fai_file(fasta_fpath):
-    l = 0
-    total_offset = 0
-    chr_offset = 0
-    chr_name = None
-    fai_fpath = fasta_fpath + '.fai'
+    """
+        Writes samtools-compatible index fasta_fpath.fai: name, length, offset of the sequence,
+        bases per line and bytes per line (including the line end) for each FASTA entry
+    """
     fai_fields = []
-    with open(fasta_fpath) as in_f:
-        for raw_line in in_f:
-            if raw_line.find('\r') != -1:
-                lines = raw_line.split('\r')
-            else:
-                lines = [raw_line]
-            for line in lines:
-                if not line:
-                    continue
-                if line[0] == '>':
-                    if l:  # not the first sequence in FASTA
-                        fai_fields.append([chr_name, l, total_offset, len(chr_line.strip()), len(chr_line)])
-                        total_offset += chr_offset
-                        l = 0
-                        chr_offset = 0
-                    chr_name = __get_entry_name(line)
-                    total_offset += len(line)
-                else:
-                    if not l:
-                        chr_line = line
-                    l += len(line.strip())
-                    chr_offset += len(line)
-    fai_fields.append([chr_name, l, total_offset, len(chr_line.strip()), len(chr_line)])
-    with open(fai_fpath, 'w') as out_f:
+    offset = 0
+    with open(fasta_fpath, 'rb') as in_f:
+        for line in in_f:
+            if line.startswith(b'>'):
+                fai_fields.append([__get_entry_name(line.decode()), 0, offset + len(line), 0, 0])
+            elif fai_fields:
+                fields = fai_fields[-1]
+                line_bases = len(line.strip())
+                if not fields[3]:
+                    fields[3] = line_bases
+                    fields[4] = len(line)
+                fields[1] += line_bases
+            offset += len(line)
+    with open(fasta_fpath + '.fai', 'w') as out_f:
         for fields in fai_fields:
             out_f.write('\t'.join([str(fs) for fs in fields]) + '\n')
 
 
+def read_fai_file(fasta_fpath):
+    """
+        Returns OrderedDict: sequence name --> (length, offset, line bases, line width) from fasta_fpath.fai
+        or None if there is no index or it is older than the FASTA file
+    """
+    fai_fpath = fasta_fpath + '.fai'
+    if not os.path.isfile(fai_fpath) or os.path.getmtime(fai_fpath) < os.path.getmtime(fasta_fpath):
+        return None
+    entries = OrderedDict()
+    with open(fai_fpath) as fai_f:
+        for line in fai_f:
+            fields = line.split('\t')
+            if len(fields) < 5:
+                return None
+            entries[fields[0]] = tuple(int(field) for field in fields[1:5])
+    return entries
+
+
+class FastaIndex(object):
+    """
+        Random access to sequences of an uncompressed FASTA file with a .fai index.
+        The file is memory-mapped on the first access (in each process, so the index can be sent to workers)
+        and unmapped by close(), the index can also be used as a context manager.
+        Iteration returns (name, seq) in the file order, same as read_fasta
+    """
+    def __init__(self, fasta_fpath, entries):
+        self.fasta_fpath = fasta_fpath
+        self.entries = entries
+        self._mapped_file = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_mapped_file'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+            Unmaps the file, it is mapped again if sequences are fetched after that
+        """
+        if self._mapped_file is not None:
+            self._mapped_file.close()
+            self._mapped_file = None
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for name in self.entries:
+            yield name, self.fetch(name)
+
+    def length(self, name):
+        return self.entries[name][0]
+
+    def lengths(self):
+        return OrderedDict((name, entry[0]) for name, entry in self.entries.items())
+
+    def fetch(self, name, start=0, end=None):
+        """
+            Returns sequence[start:end] (0-based, end is exclusive) read directly from the file
+        """
+        length, offset, line_bases, line_width = self.entries[name]
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return ''
+        if self._mapped_file is None:
+            with open(self.fasta_fpath, 'rb') as in_f:
+                self._mapped_file = mmap.mmap(in_f.fileno(), 0, access=mmap.ACCESS_READ)
+        start_offset = offset + (start // line_bases) * line_width + start % line_bases
+        end_offset = offset + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases + 1
+        return self._mapped_file[start_offset:end_offset].translate(None, WHITESPACES).decode()
+
+    def sequence(self, name):
+        return LazySequence(self, name)
+
+
+class LazySequence(object):
+    """
+        Sequence of a FASTA entry that is read from disk only when sliced, e.g. to count Ns in a gap
+    """
+    __slots__ = ('index', 'name', '_length')
+
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self._length = index.length(name)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, end, step = key.indices(self._length)
+            seq = self.index.fetch(self.name, start, end)
+            return seq if step == 1 else seq[::step]
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('sequence index out of range')
+        return self.index.fetch(self.name, key, key + 1)
+
+    def __str__(self):
+        return self.index.fetch(self.name)
+
+    def __contains__(self, sub):
+        return sub in str(self)
+
+    def count(self, sub):
+        return str(self).count(sub)
+
+
+def get_fasta_index(fasta_fpath, create=False):
+    """
+        Returns FastaIndex for fasta_fpath or None if there is no up-to-date .fai index or the file is compressed
+        (offsets in a .fai next to a compressed file, e.g. from samtools faidx for bgzip, do not point into
+        the raw file bytes). If create is set, the index is built for uncompressed files that do not have it
+    """
+    if os.path.splitext(fasta_fpath)[1] in COMPRESSED_FASTA_EXTS:
+        return None
+    entries = read_fai_file(fasta_fpath)
+    if entries is None and create:
+        create_fai_file(fasta_fpath)
+        entries = read_fai_file(fasta_fpath)
+    if entries is None:
+        return None
+    return FastaIndex(fasta_fpath, entries)
+
+
+def read_fasta_lazily(fpath):
+    """
+        Same as read_fasta but, if fpath has a .fai index, sequences are LazySequence objects
+        and the file is not parsed
+    """
+    index = get_fasta_index(fpath)
+    if index is None:
+        for name, seq in read_fasta(fpath):
+            yield name, seq
+        return
+    try:
+        for name in index.entries:
+            yield name, index.sequence(name)
+    finally:
+        index.close()
+
+
 def split_fasta(fpath, output_dirpath):
     """
         Takes filename of FASTA-file and directory to output
@@ -257,14 +520,45 @@ def print_fasta(fasta):
             print(seq[i:i + 60])
 
 
-def write_fasta(fpath, fasta, mode='w'):
-    outfile = open(fpath, mode)
+class FastaWriter(object):
+    """
+        Writes FASTA entries with 60 bases per line one by one.
+        If create_fai is set, the samtools-compatible index fpath.fai is written on close
+        (offsets are computed on the fly, so the file is not read again)
+    """
+    def __init__(self, fpath, mode='w', create_fai=False):
+        self.fpath = fpath
+        self._out_f = open(fpath, mode)
+        self._fai_fields = [] if create_fai and mode == 'w' else None
+        self._offset = 0  # in bytes, names (and rarely sequences) may contain non-ASCII characters
+
+    def write(self, name, seq):
+        header = '>%s\n' % name
+        self._out_f.write(header)
+        if self._fai_fields is not None:
+            self._offset += self._encoded_len(header)
+            line_bases = min(len(seq), 60)
+            self._fai_fields.append((name.split()[0], len(seq), self._offset, line_bases, line_bases + 1 if line_bases else 0))
+            self._offset += self._encoded_len(seq) + (len(seq) + 59) // 60
+        for i in range(0, len(seq), 60):
+            self._out_f.write(seq[i:i + 60] + '\n')
 
+    def _encoded_len(self, text):
+        return len(text.encode(self._out_f.encoding))
+
+    def close(self):
+        self._out_f.close()
+        if self._fai_fields is not None:
+            with open(self.fpath + '.fai', 'w') as out_f:
+                for fields in self._fai_fields:
+                    out_f.write('\t'.join([str(fs) for fs in fields]) + '\n')
+
+
+def write_fasta(fpath, fasta, mode='w', create_fai=False):
+    writer = FastaWriter(fpath, mode, create_fai)
     for name, seq in fasta:
-        outfile.write('>%s\n' % name)
-        for i in range(0, len(seq), 60):
-            outfile.write(seq[i:i + 60] + '\n')
-    outfile.close()
+        writer.write(name, seq)
+    writer.close()
 
 
 def comp(letter):
@@ -18,7 +18,7 @@ except ImportError:
 
 from quast_libs import reporting, qconfig, qutils
 from quast_libs.ca_utils.misc import open_gzipsafe
-from quast_libs.fastaparser import write_fasta, get_chr_lengths_from_fastafile
+from quast_libs.fastaparser import read_fasta, write_fasta, get_chr_lengths_from_fastafile, FastaWriter
 from quast_libs.genes_parser import Gene
 
 from quast_libs.log import get_logger
@@ -28,6 +28,7 @@ logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
 LICENSE_LIMITATIONS_MODE = False
 OUTPUT_FASTA = False  # whether output only .gff or with corresponding .fasta files
+MIN_CHUNK_LENGTH = 5000000  # large assemblies are split into groups of contigs of at least this total length
 
 
 def gmhmm_p(tool_exec, fasta_fpath, heu_fpath, out_fpath, err_file, index):
@@ -43,6 +44,64 @@ def gmhmm_p(tool_exec, fasta_fpath, heu_fpath, out_fpath, err_file, index):
     return return_code == 0 and os.path.isfile(out_fpath)
 
 
+def split_fasta_into_chunks(fasta_fpath, tmp_dirpath, max_chunks):
+    """
+        Splits contigs into at most max_chunks groups of consecutive contigs with similar total lengths.
+        Returns paths to FASTA files of the groups or [fasta_fpath] if the assembly is too small to be split
+    """
+    contig_lengths = get_chr_lengths_from_fastafile(fasta_fpath)
+    total_length = sum(contig_lengths.values())
+    chunks_num = min(max_chunks, total_length // MIN_CHUNK_LENGTH, len(contig_lengths))
+    if chunks_num < 2:
+        return [fasta_fpath]
+
+    chunks_dirpath = tempfile.mkdtemp(dir=tmp_dirpath)
+    chunk_length = total_length / chunks_num
+    chunk_fpaths = []
+    writer = None
+    cur_length = 0
+    for name, seq in read_fasta(fasta_fpath):
+        if writer is None or (cur_length >= chunk_length * len(chunk_fpaths) and len(chunk_fpaths) < chunks_num):
+            if writer is not None:
+                writer.close()
+            chunk_fpaths.append(os.path.join(chunks_dirpath, 'chunk_%d.fasta' % len(chunk_fpaths)))
+            writer = FastaWriter(chunk_fpaths[-1])
+        writer.write(name, seq)
+        cur_length += len(seq)
+    writer.close()
+    return chunk_fpaths
+
+
+def gmhmm_p_chunks(tool_exec, chunks, heu_fpath, err_file, index, num_threads):
+    """
+        Runs GeneMark.hmm with the same model on chunks, given as (FASTA, output) paths, in num_threads threads.
+        Contigs keep their names in chunks, so genes are merged in the order of chunks as they are.
+        Returns None if any of the runs failed
+    """
+    if len(chunks) == 1:
+        fasta_fpath, out_fpath = chunks[0]
+        if gmhmm_p(tool_exec, fasta_fpath, heu_fpath, out_fpath, err_file, index):
+            return parse_gmhmm_out(out_fpath)
+        return None
+
+    def run(chunk):
+        fasta_fpath, out_fpath = chunk
+        with open(out_fpath + '.stderr', 'w') as chunk_err_file:
+            if not gmhmm_p(tool_exec, fasta_fpath, heu_fpath, out_fpath, chunk_err_file, index):
+                return None
+        return parse_gmhmm_out(out_fpath)
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        genes_by_chunks = list(executor.map(run, chunks))
+    for _, out_fpath in chunks:
+        with open(out_fpath + '.stderr') as chunk_err_file:
+            shutil.copyfileobj(chunk_err_file, err_file)
+    if any(chunk_genes is None for chunk_genes in genes_by_chunks):
+        return None
+    return [gene for chunk_genes in genes_by_chunks for gene in chunk_genes]
+
+
 def install_genemark():
     """Installation instructions for GeneMark.
     Please, copy key "gm_key" into users home directory as:
@@ -186,16 +245,17 @@ def gmhmm_p_everyGC(tool_dirpath, fasta_fpath, err_fpath, index, tmp_dirpath, nu
     if return_code != 0:
         return
 
-    genes = []
+    # the model is trained on the whole assembly, so predictions in chunks are the same as in the whole file
     tool_exec_fpath = os.path.join(tool_dirpath, 'gmhmmp')
     sub_fasta_fpath = os.path.join(tmp_dirpath, fasta_name)
-    out_fpath = sub_fasta_fpath + '.gmhmm'
     heu_fpath = os.path.join(tmp_dirpath, fasta_name + '_hmm_heuristic.mod')
+    chunk_fpaths = split_fasta_into_chunks(fasta_fpath, tmp_dirpath, num_threads)
+    if len(chunk_fpaths) == 1:
+        chunks = [(fasta_fpath, sub_fasta_fpath + '.gmhmm')]
+    else:
+        chunks = [(chunk_fpath, chunk_fpath + '.gmhmm') for chunk_fpath in chunk_fpaths]
     with open(err_fpath, 'a') as err_file:
-        ok = gmhmm_p(tool_exec_fpath, fasta_fpath, heu_fpath,
-                   out_fpath, err_file, index)
-        if ok:
-            genes = parse_gmhmm_out(out_fpath)
+        genes = gmhmm_p_chunks(tool_exec_fpath, chunks, heu_fpath, err_file, index, num_threads) or []
 
     if not qconfig.debug:
         shutil.rmtree(tmp_dirpath)
@@ -206,13 +266,11 @@ def gmhmm_p_everyGC(tool_dirpath, fasta_fpath, err_fpath, index, tmp_dirpath, nu
 def gmhmm_p_metagenomic(tool_dirpath, fasta_fpath, err_fpath, index, tmp_dirpath=None, num_threads=None):
     tool_exec_fpath = os.path.join(tool_dirpath, 'gmhmmp')
     heu_fpath = os.path.join(tool_dirpath, '../MetaGeneMark_v1.mod')
-    gmhmm_fpath = fasta_fpath + '.gmhmm'
+    chunk_fpaths = split_fasta_into_chunks(fasta_fpath, tmp_dirpath, num_threads or 1) if tmp_dirpath else [fasta_fpath]
+    chunks = [(chunk_fpath, chunk_fpath + '.gmhmm') for chunk_fpath in chunk_fpaths]
 
     with open(err_fpath, 'w') as err_file:
-        if gmhmm_p(tool_exec_fpath, fasta_fpath, heu_fpath, gmhmm_fpath, err_file, index):
-            return parse_gmhmm_out(gmhmm_fpath)
-        else:
-            return None
+        return gmhmm_p_chunks(tool_exec_fpath, chunks, heu_fpath, err_file, index, num_threads or 1)
 
 
 def gm_es(tool_dirpath, fasta_fpath, err_fpath, index, tmp_dirpath, num_threads):
@@ -8,14 +8,16 @@
 from __future__ import with_statement
 import logging
 import os
+import re
 from collections import defaultdict
 
-from quast_libs import fastaparser, genes_parser, reporting, qconfig, qutils
+from quast_libs import fastaparser, genes_parser, reporting, qconfig, qutils, reference_profile
 from quast_libs.log import get_logger
 from quast_libs.qutils import run_parallel
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 ref_lengths_by_contigs = {}
+COVERED_BYTE = b'\x01'
 
 
 # reading genes and operons
@@ -88,9 +90,9 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     #  338980   339138  |     2298     2134  |      159      165  |    79.76  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
     #  374145   374355  |     2306     2097  |      211      210  |    85.45  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
 
-    genome_mapping = {}
+    genome_mapping = {}  # one byte per reference position: 1 if covered, 0 otherwise
     for chr_name, chr_len in reference_chromosomes.items():
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
+        genome_mapping[chr_name] = bytearray(chr_len + 1)
 
     contig_tuples = fastaparser.read_fasta(contigs_fpath)  # list of FASTA entries (in tuples: name, seq)
     sorted_contig_tuples = sorted(enumerate(contig_tuples), key=lambda x: len(x[1][1]), reverse=True)
@@ -112,12 +114,9 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
             aligned_blocks_by_contig_name[name] = []
     with open(coords_fpath) as coordfile:
         for line in coordfile:
-            s1 = int(line.split('|')[0].split()[0])
-            e1 = int(line.split('|')[0].split()[1])
-            s2 = int(line.split('|')[1].split()[0])
-            e2 = int(line.split('|')[1].split()[1])
-            contig_name = line.split()[12].strip()
-            chr_name = line.split()[11].strip()
+            fs = line.split()
+            s1, e1, s2, e2 = int(fs[0]), int(fs[1]), int(fs[3]), int(fs[4])
+            chr_name, contig_name = fs[11], fs[12]
 
             if chr_name not in genome_mapping:
                 logger.error("Something went wrong and chromosome names in your coords file (" + coords_base_fpath + ") " \
@@ -127,15 +126,13 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
             if gene_searching_enabled:
                 aligned_blocks_by_contig_name[contig_name].append(AlignedBlock(seqname=chr_name, start=s1, end=e1,
                                                                                contig=contig_name, start_in_contig=s2, end_in_contig=e2))
-            for i in range(s1, e1):
-                if e1 >= len(genome_mapping[chr_name]):
-                    continue
-                genome_mapping[chr_name][i] = 1
+            if s1 < e1 < len(genome_mapping[chr_name]):
+                genome_mapping[chr_name][s1:e1] = COVERED_BYTE * (e1 - s1)
 
     for chr_name in genome_mapping.keys():
-        for i in ns_by_chromosomes[chr_name]:
-            genome_mapping[chr_name][i] = 0
-        ref_lengths[chr_name] = sum(genome_mapping[chr_name])
+        for ns_start, ns_end in ns_by_chromosomes[chr_name]:
+            genome_mapping[chr_name][ns_start:ns_end] = bytes(ns_end - ns_start)
+        ref_lengths[chr_name] = genome_mapping[chr_name].count(COVERED_BYTE)
 
     if qconfig.space_efficient and coords_fpath.endswith('.filtered'):
         os.remove(coords_fpath)
@@ -145,20 +142,16 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     if qconfig.analyze_gaps:
         gaps_fpath = os.path.join(genome_stats_dirpath, corr_assembly_label + '_gaps.txt') if not qconfig.space_efficient else '/dev/null'
         with open(gaps_fpath, 'w') as gaps_file:
+            # gaps are runs of at least min_gap_size positions that are neither covered nor Ns
+            gap_pattern = re.compile(b'\\x00{%d,}' % max(qconfig.min_gap_size, 1))
             for chr_name, chr_len in reference_chromosomes.items():
                 gaps_file.write(chr_name + '\n')
-                cur_gap_size = 0
-                for i in range(1, chr_len + 1):
-                    if genome_mapping[chr_name][i] == 1 or i in ns_by_chromosomes[chr_name]:
-                        if cur_gap_size >= qconfig.min_gap_size:
-                            gaps_count += 1
-                            gaps_file.write(str(i - cur_gap_size) + ' ' + str(i - 1) + '\n')
-                        cur_gap_size = 0
-                    else:
-                        cur_gap_size += 1
-                if cur_gap_size >= qconfig.min_gap_size:
+                covered_or_ns = genome_mapping[chr_name]
+                for ns_start, ns_end in ns_by_chromosomes[chr_name]:
+                    covered_or_ns[ns_start:ns_end] = COVERED_BYTE * (ns_end - ns_start)
+                for gap in gap_pattern.finditer(covered_or_ns, 1):
                     gaps_count += 1
-                    gaps_file.write(str(chr_len - cur_gap_size + 1) + ' ' + str(chr_len) + '\n')
+                    gaps_file.write(str(gap.start()) + ' ' + str(gap.end() - 1) + '\n')
 
     results["gaps_count"] = gaps_count
     results[reporting.Fields.GENES + "_full"] = None
@@ -254,7 +247,7 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
     if not os.path.isdir(genome_stats_dirpath):
         os.mkdir(genome_stats_dirpath)
 
-    genome_size, reference_chromosomes, ns_by_chromosomes = fastaparser.get_genome_stats(ref_fpath)
+    genome_size, reference_chromosomes, ns_by_chromosomes = reference_profile.get(ref_fpath).get_genome_stats()
 
     # reading genome size
     # genome_size = fastaparser.get_lengths_from_fastafile(reference)[0]
@@ -340,7 +333,7 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
     for chr_name, chr_len in reference_chromosomes.items():
         aligned_len = max(ref_lengths_by_contigs[chr_name])
         res_file.write('\t' + chr_name + ' (total length: ' + str(chr_len) + ' bp, ' +
-                       'total length without N\'s: ' + str(chr_len - len(ns_by_chromosomes[chr_name])) +
+                       'total length without N\'s: ' + str(chr_len - fastaparser.get_ns_count(ns_by_chromosomes[chr_name])) +
                        ' bp, maximal covered length: ' + str(aligned_len) + ' bp)\n')
     res_file.write('\n')
     res_file.write('total genome size: ' + str(genome_size) + '\n\n')
@@ -10,11 +10,12 @@ import os
 import tempfile
 import itertools
 import csv
+import heapq
 import shutil
 
 from quast_libs import reporting, qconfig, qutils
 from quast_libs.ca_utils.misc import open_gzipsafe
-from quast_libs.fastaparser import read_fasta, write_fasta, rev_comp
+from quast_libs.fastaparser import read_fasta, write_fasta, rev_comp, get_fasta_index
 from quast_libs.genemark import add_genes_to_fasta
 from quast_libs.genes_parser import Gene
 
@@ -24,6 +25,7 @@ from quast_libs.qutils import compile_tool, get_path_to_program, run_parallel
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
 OUTPUT_FASTA = False # whether output only .gff or with corresponding .fasta files
+BATCHES_PER_THREAD = 4  # contigs are split into batches of similar total length to balance the load of threads
 
 
 def merge_gffs(gffs, out_path):
@@ -50,50 +52,98 @@ def parse_gff(gff_path):
     gff_file.close()
 
 
-def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths, err_path, tmp_dir, index):
-    def run(contig_path, tmp_path):
-        with open(err_path, 'a') as err_file:
+def split_contigs_into_batches(contig_lengths, batches_num):
+    """
+        Splits contigs (given as (name, length) pairs) into batches of approximately the same total length.
+        Returns lists of (contig number, name) sorted by contig numbers
+    """
+    batches = [[] for _ in range(batches_num)]
+    batches_lengths = [(0, batch_idx) for batch_idx in range(batches_num)]
+    # the longest contigs are placed first, each one to the currently shortest batch
+    for seq_num, (name, length) in sorted(enumerate(contig_lengths), key=lambda contig: -contig[1][1]):
+        batch_length, batch_idx = heapq.heappop(batches_lengths)
+        batches[batch_idx].append((seq_num, name))
+        heapq.heappush(batches_lengths, (batch_length + length, batch_idx))
+    return [sorted(batch) for batch in batches if batch]
+
+
+def run_glimmer_batch(tool_exec_fpath, trained_dir, contigs_index, batch, base_dir, index):
+    """
+        GlimmerHMM predicts genes only in the first sequence of a FASTA file,
+        so contigs of the batch are written and processed one by one.
+        Returns GFF files of the successfully processed contigs and the file with stderr of all runs
+    """
+    batch_err_path = os.path.join(base_dir, str(batch[0][0]) + '.stderr')
+    gffs = []
+    with open(batch_err_path, 'w') as err_file:
+        for seq_num, name in batch:
+            seq_num = str(seq_num)
+            contig_path = os.path.join(base_dir, seq_num + '.fasta')
+            gff_path = os.path.join(base_dir, seq_num + '.gff')
+
+            write_fasta(contig_path, [(name[:qutils.MAX_CONTIG_NAME_GLIMMER], contigs_index.fetch(name))])
             return_code = qutils.call_subprocess(
-                [tool_exec_fpath, contig_path, '-d', trained_dir, '-g', '-o', tmp_path],
+                [tool_exec_fpath, contig_path, '-d', trained_dir, '-g', '-o', gff_path],
                 stdout=err_file,
                 stderr=err_file,
                 indent='  ' + qutils.index_to_str(index) + '  ')
-            return return_code
+            if return_code == 0:
+                gffs.append((int(seq_num), name, gff_path))
+            if not qconfig.debug:
+                os.remove(contig_path)
+    return gffs, batch_err_path
+
 
+def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths, err_path, tmp_dir, index, threads=1):
     # Note: why arabidopsis? for no particular reason, really.
     trained_dir = os.path.join(tool_dir, 'trained', 'arabidopsis')
 
-    contigs = {}
-    gffs = []
     base_dir = tempfile.mkdtemp(dir=tmp_dir)
-    for seq_num, (ind, seq) in enumerate(read_fasta(fasta_fpath)):
-        seq_num = str(seq_num)
-        ind = ind[:qutils.MAX_CONTIG_NAME_GLIMMER]
-        contig_path = os.path.join(base_dir, seq_num + '.fasta')
-        gff_path = os.path.join(base_dir, seq_num + '.gff')
+    # contigs are read by indexed random access instead of keeping the whole assembly in memory
+    contigs_index = get_fasta_index(fasta_fpath, create=True)
+    if contigs_index is None:  # compressed file
+        plain_fasta_fpath = os.path.join(base_dir, 'contigs.fasta')
+        write_fasta(plain_fasta_fpath, read_fasta(fasta_fpath), create_fai=True)
+        contigs_index = get_fasta_index(plain_fasta_fpath)
+
+    contig_lengths = list(contigs_index.lengths().items())
+    batches = split_contigs_into_batches(contig_lengths, min(len(contig_lengths), threads * BATCHES_PER_THREAD)) \
+        if contig_lengths else []
+    batch_args = [(tool_exec_fpath, trained_dir, contigs_index, batch, base_dir, index) for batch in batches]
+    if threads > 1 and len(batches) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            batch_results = list(executor.map(lambda args: run_glimmer_batch(*args), batch_args))
+    else:
+        batch_results = [run_glimmer_batch(*args) for args in batch_args]
 
-        write_fasta(contig_path, [(ind, seq)])
-        if run(contig_path, gff_path) == 0:
-            gffs.append(gff_path)
-            contigs[ind] = seq
+    gffs = []
+    with open(err_path, 'a') as err_file:
+        for batch_gffs, batch_err_path in batch_results:
+            gffs.extend(batch_gffs)
+            with open(batch_err_path) as batch_err_file:
+                shutil.copyfileobj(batch_err_file, err_file)
+    gffs.sort()
 
     if not gffs:
+        contigs_index.close()
         return None, None, None, None, None, None
 
+    # names in GFF are shortened for GlimmerHMM
+    contig_names = dict((name[:qutils.MAX_CONTIG_NAME_GLIMMER], name) for _, name, _ in gffs)
     out_gff_fpath = out_fpath + '_genes.gff' + ('.gz' if not qconfig.no_gzip else '')
-    out_gff_path = merge_gffs(gffs, out_gff_fpath)
+    out_gff_path = merge_gffs([gff_path for _, _, gff_path in gffs], out_gff_fpath)
     unique, total = set(), 0
     genes = []
     for contig, gene_id, start, end, strand in parse_gff(out_gff_path):
         total += 1
-        if strand == '+':
-            gene_seq = contigs[contig][start - 1:end]
-        else:
-            gene_seq = rev_comp(contigs[contig][start - 1:end])
+        gene_seq = contigs_index.fetch(contig_names[contig], start - 1, end)
+        if strand != '+':
+            gene_seq = rev_comp(gene_seq)
         if gene_seq not in unique:
             unique.add(gene_seq)
         gene = Gene(contig=contig, start=start, end=end, strand=strand, seq=gene_seq)
-        gene.is_full = gene.start > 1 and gene.end < len(contigs[contig])
+        gene.is_full = gene.start > 1 and gene.end < contigs_index.length(contig_names[contig])
         genes.append(gene)
 
     full_cnt = [sum([gene.end - gene.start >= threshold for gene in genes if gene.is_full]) for threshold in gene_lengths]
@@ -101,6 +151,7 @@ def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths,
     if OUTPUT_FASTA:
         out_fasta_fpath = out_fpath + '_genes.fasta'
         add_genes_to_fasta(genes, out_fasta_fpath)
+    contigs_index.close()
     if not qconfig.debug:
         shutil.rmtree(base_dir)
 
@@ -108,7 +159,7 @@ def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths,
     return out_gff_path, genes, len(unique), total, full_cnt, partial_cnt
 
 
-def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath):
+def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath, threads=1):
     assembly_label = qutils.label_from_fpath(contigs_fpath)
     corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
 
@@ -121,7 +172,7 @@ def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath,
     #    fasta_path, out_path, gene_lengths, err_path)
 
     out_gff_path, genes, unique, total, full_genes, partial_genes = glimmerHMM(tool_dirpath, tool_exec_fpath,
-        contigs_fpath, out_fpath, gene_lengths, err_fpath, tmp_dirpath, index)
+        contigs_fpath, out_fpath, gene_lengths, err_fpath, tmp_dirpath, index, threads)
 
     if out_gff_path:
         logger.info('  ' + qutils.index_to_str(index) + '  Genes = ' + str(unique) + ' unique, ' + str(total) + ' total')
@@ -155,7 +206,9 @@ def do(contigs_fpaths, gene_lengths, out_dirpath):
         os.makedirs(tmp_dirpath)
 
     n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    parallel_args = [(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath)
+    threads_per_assembly = max(1, qconfig.max_threads // n_jobs)
+    parallel_args = [(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath,
+                      threads_per_assembly)
                      for index, contigs_fpath in enumerate(contigs_fpaths)]
     genes_list, unique, full_genes, partial_genes = run_parallel(predict_genes, parallel_args, n_jobs)
 
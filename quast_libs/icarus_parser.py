@@ -80,8 +80,8 @@ def parse_aligner_contig_report(report_fpath, ref_names, cumulative_ref_lengths)
 
 def parse_contigs_fpath(contigs_fpath):
     contigs = []
-    for name, seq in fastaparser.read_fasta(contigs_fpath):
-        contig = Contig(name=name, size=len(seq))
+    for name, seq_len in fastaparser.get_chr_lengths_from_fastafile(contigs_fpath).items():
+        contig = Contig(name=name, size=seq_len)
         contigs.append(contig)
     return contigs
 
@@ -10,6 +10,11 @@ import os
 import re
 from collections import defaultdict
 
+try:
+   from collections import OrderedDict
+except ImportError:
+   from quast_libs.site_packages.ordered_dict import OrderedDict
+
 from quast_libs import qconfig
 
 qconfig.check_python_version()
@@ -20,6 +25,8 @@ from quast_libs.qutils import correct_seq, correct_name, get_uniq_name, run_para
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_META_NAME)
 
+MAX_OPENED_FILES = 256  # per-reference files opened at once while splitting contigs and alignments by references
+
 
 class Assembly:
     def __init__(self, fpath, label):
@@ -28,6 +35,32 @@ class Assembly:
         self.name = os.path.splitext(os.path.basename(self.fpath))[0]
 
 
+class FilesPool:
+    """
+        Keeps files opened for appending, at most max_opened at a time:
+        the least recently used one is closed when a new one is needed
+    """
+    def __init__(self, open_file, max_opened=MAX_OPENED_FILES):
+        self.open_file = open_file
+        self.max_opened = max_opened
+        self.files = OrderedDict()
+
+    def get(self, fpath):
+        opened_file = self.files.pop(fpath, None)
+        if opened_file is None:
+            if len(self.files) >= self.max_opened:
+                _, lru_file = self.files.popitem(last=False)
+                lru_file.close()
+            opened_file = self.open_file(fpath)
+        self.files[fpath] = opened_file
+        return opened_file
+
+    def close(self):
+        for opened_file in self.files.values():
+            opened_file.close()
+        self.files.clear()
+
+
 def parallel_partition_contigs(asm, assemblies_by_ref, corrected_dirpath, alignments_fpath_template):
     assembly_label = qutils.label_from_fpath(asm.fpath)
     corr_assembly_label = qutils.label_from_fpath_for_fname(asm.fpath)
@@ -35,32 +68,23 @@ def parallel_partition_contigs(asm, assemblies_by_ref, corrected_dirpath, alignm
     added_ref_asm = []
     not_aligned_fname = corr_assembly_label + '_not_aligned_anywhere.fasta'
     not_aligned_fpath = os.path.join(corrected_dirpath, not_aligned_fname)
-    contigs = {}
-    aligned_contig_names = set()
-    aligned_contigs_for_each_ref = {}
-    contigs_seq = fastaparser.read_fasta_one_time(asm.fpath)
+    # contig name --> files of the references it is aligned to
+    ref_contigs_fpaths_by_contig = defaultdict(list)
+    is_partitioned = False
     alignments_fpath = alignments_fpath_template % corr_assembly_label
     if os.path.exists(alignments_fpath):
         with open(alignments_fpath) as f:
             for line in f:
                 values = line.split()
                 if values[0] in contigs_analyzer.ref_labels_by_chromosomes.keys():
+                    is_partitioned = True
                     ref_name = contigs_analyzer.ref_labels_by_chromosomes[values[0]]
-                    ref_contigs_names = values[1:]
                     ref_contigs_fpath = os.path.join(
                         corrected_dirpath, corr_assembly_label + '_to_' + ref_name + '.fasta')
-                    if ref_name not in aligned_contigs_for_each_ref:
-                        aligned_contigs_for_each_ref[ref_name] = []
-
-                    for (cont_name, seq) in contigs_seq:
-                        if not cont_name in contigs:
-                            contigs[cont_name] = seq
-
-                        if cont_name in ref_contigs_names and cont_name not in aligned_contigs_for_each_ref[ref_name]:
-                            # Collecting all aligned contigs names in order to further extract not aligned
-                            aligned_contig_names.add(cont_name)
-                            aligned_contigs_for_each_ref[ref_name].append(cont_name)
-                            fastaparser.write_fasta(ref_contigs_fpath, [(cont_name, seq)], 'a')
+                    for cont_name in values[1:]:
+                        ref_contigs_fpaths = ref_contigs_fpaths_by_contig[cont_name]
+                        if ref_contigs_fpath not in ref_contigs_fpaths:
+                            ref_contigs_fpaths.append(ref_contigs_fpath)
 
                     ref_asm = Assembly(ref_contigs_fpath, assembly_label)
                     if ref_asm.name not in added_ref_asm:
@@ -70,10 +94,25 @@ def parallel_partition_contigs(asm, assemblies_by_ref, corrected_dirpath, alignm
         if qconfig.space_efficient:
             os.remove(alignments_fpath)
 
-    # Extraction not aligned contigs
-    all_contigs_names = set(contigs.keys())
-    not_aligned_contigs_names = all_contigs_names - aligned_contig_names
-    fastaparser.write_fasta(not_aligned_fpath, [(name, contigs[name]) for name in not_aligned_contigs_names])
+    # the assembly is read once: aligned contigs are appended to the files of their references
+    # and the rest is extracted as not aligned contigs
+    ref_writers = FilesPool(lambda fpath: fastaparser.FastaWriter(fpath, 'a'))
+    not_aligned_writer = fastaparser.FastaWriter(not_aligned_fpath)
+    try:
+        if is_partitioned:
+            written_contigs = set()
+            for cont_name, seq in fastaparser.read_fasta(asm.fpath):
+                if cont_name in written_contigs:
+                    continue
+                written_contigs.add(cont_name)
+                if cont_name in ref_contigs_fpaths_by_contig:
+                    for ref_contigs_fpath in ref_contigs_fpaths_by_contig[cont_name]:
+                        ref_writers.get(ref_contigs_fpath).write(cont_name, seq)
+                else:
+                    not_aligned_writer.write(cont_name, seq)
+    finally:
+        ref_writers.close()
+        not_aligned_writer.close()
 
     not_aligned_asm = Assembly(not_aligned_fpath, asm.label)
     return assemblies_by_ref, not_aligned_asm
@@ -100,6 +139,63 @@ def partition_contigs(assemblies, ref_fpaths, corrected_dirpath, alignments_fpat
     return assemblies_by_ref, not_aligned_assemblies
 
 
+def reuse_combined_alignments(combined_output_dirpath, output_dirpath_per_ref, assemblies_by_reference):
+    """
+        Splits alignments of the combined reference run by references and saves them with the successful check
+        files into the outputs of the per-reference runs, so these runs use existing alignments instead of
+        aligning the same contigs to the same chromosomes again
+    """
+    from quast_libs.ca_utils.align_contigs import get_aux_out_fpaths, create_successful_check
+    combined_minimap_dirpath = os.path.join(combined_output_dirpath, 'contigs_reports', qconfig.minimap_output_dirname)
+    ref_assemblies_by_labels = defaultdict(list)
+    for ref_fpath, ref_assemblies in assemblies_by_reference:
+        for ref_asm in ref_assemblies:
+            ref_assemblies_by_labels[ref_asm.label].append((ref_fpath, ref_asm))
+
+    for label, ref_assemblies in ref_assemblies_by_labels.items():
+        corr_assembly_label = qutils.slugify(label)
+        combined_coords_fpath = get_aux_out_fpaths(os.path.join(combined_minimap_dirpath, corr_assembly_label))[0]
+        if not os.path.isfile(combined_coords_fpath):
+            continue
+        # chromosome --> (contigs of the assembly partitioned to its reference, per-reference .coords)
+        coords_by_chromosomes = {}
+        seeded_runs = []
+        for ref_fpath, ref_asm in ref_assemblies:
+            if not os.path.isfile(ref_asm.fpath):
+                continue
+            ref_name = qutils.name_from_fpath(ref_fpath)
+            minimap_dirpath = os.path.join(output_dirpath_per_ref, ref_name, 'contigs_reports', qconfig.minimap_output_dirname)
+            if not os.path.isdir(minimap_dirpath):
+                os.makedirs(minimap_dirpath)
+            out_basename = os.path.join(minimap_dirpath, corr_assembly_label)
+            coords_fpath = get_aux_out_fpaths(out_basename)[0]
+            open(coords_fpath, 'w').close()
+            ref_contigs = set(fastaparser.get_chr_lengths_from_fastafile(ref_asm.fpath).keys())
+            for chr_name, chr_ref_name in contigs_analyzer.ref_labels_by_chromosomes.items():
+                if chr_ref_name == ref_name:
+                    coords_by_chromosomes[chr_name] = (ref_contigs, coords_fpath)
+            seeded_runs.append((out_basename, ref_asm.fpath, ref_fpath))
+
+        coords_files = FilesPool(lambda fpath: open(fpath, 'a'))
+        try:
+            with open(combined_coords_fpath) as combined_coords_f:
+                for line in combined_coords_f:
+                    values = line.split()
+                    chr_name, contig = values[11], values[12]
+                    if chr_name in coords_by_chromosomes:
+                        ref_contigs, coords_fpath = coords_by_chromosomes[chr_name]
+                        if contig in ref_contigs:
+                            coords_files.get(coords_fpath).write(line)
+        finally:
+            coords_files.close()
+        for out_basename, contigs_fpath, ref_fpath in seeded_runs:
+            coords_fpath = get_aux_out_fpaths(out_basename)[0]
+            if os.path.getsize(coords_fpath):
+                create_successful_check(out_basename + '.sf', contigs_fpath, ref_fpath)
+            else:
+                os.remove(coords_fpath)
+
+
 def correct_assemblies(contigs_fpaths, output_dirpath, labels):
     corrected_dirpath = os.path.join(output_dirpath, qconfig.corrected_dirname)
     # we need correction but do not need min-contig filtration
@@ -212,7 +212,7 @@ def wrong_test_option(logger, msg):
 def clean_metaquast_args(quast_py_args, contigs_fpaths):
     opts_with_args_to_remove = ['-o', '--output-dir', '-r', '-R', '--reference', '--max-ref-number', '-l', '--labels',
                                 '--references-list', '--blast-db']
-    opts_to_remove = ['-L', '--test', '--test-no-ref', '--unique-mapping']
+    opts_to_remove = ['-L', '--test', '--test-no-ref', '--unique-mapping', '--reuse-combined-alignments']
     for contigs_fpath in contigs_fpaths:
         if contigs_fpath in quast_py_args:
             quast_py_args.remove(contigs_fpath)
@@ -730,6 +730,10 @@ def parse_options(logger, quast_args):
                  dest='unique_mapping',
                  action='store_true')
              ),
+            (['--reuse-combined-alignments'], dict(
+                 dest='reuse_combined_alignments',
+                 action='store_true')
+             ),
             (['--max-ref-number'], dict(
                  dest='max_references',
                  type='int',
@@ -0,0 +1,141 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Multi-threaded reading of BGZF files (bgzip output, i.e. gzip files made of
+# independent members with their compressed sizes stored in the headers).
+# Blocks are decompressed on a thread pool (zlib releases the GIL) and
+# returned in the original order.
+#
+############################################################################
+
+from __future__ import with_statement
+import gzip
+import io
+import struct
+import zlib
+from collections import deque
+
+from quast_libs import qconfig
+
+GZIP_MAGIC = b'\x1f\x8b\x08'
+FEXTRA = 4
+BGZF_SUBFIELD_ID = b'BC'
+BATCH_SIZE = 4 * 1024 * 1024  # compressed bytes decompressed by one task
+
+
+def _read_bgzf_block(in_f):
+    """
+        Returns the next BGZF block (the whole gzip member) or None at the end of file.
+        Raises ValueError if the data is not BGZF
+    """
+    header = in_f.read(12)
+    if not header:
+        return None
+    if len(header) < 12 or header[:3] != GZIP_MAGIC or not header[3] & FEXTRA:
+        raise ValueError('not a BGZF block')
+    xlen = struct.unpack('<H', header[10:12])[0]
+    extra = in_f.read(xlen)
+    block_size = None
+    pos = 0
+    while pos + 4 <= len(extra):
+        subfield_id = extra[pos:pos + 2]
+        subfield_len = struct.unpack('<H', extra[pos + 2:pos + 4])[0]
+        if subfield_id == BGZF_SUBFIELD_ID and subfield_len == 2:
+            block_size = struct.unpack('<H', extra[pos + 4:pos + 6])[0] + 1
+        pos += 4 + subfield_len
+    if block_size is None:
+        raise ValueError('not a BGZF block')
+    rest = in_f.read(block_size - 12 - xlen)
+    if len(rest) != block_size - 12 - xlen:
+        raise ValueError('truncated BGZF block')
+    return header + extra + rest
+
+
+def is_bgzf(fpath):
+    try:
+        with open(fpath, 'rb') as in_f:
+            return _read_bgzf_block(in_f) is not None
+    except (IOError, ValueError, struct.error):
+        return False
+
+
+def _decompress_batch(blocks):
+    return b''.join(zlib.decompress(block, 16 + zlib.MAX_WBITS) for block in blocks)
+
+
+class ParallelGzipReader(io.RawIOBase):
+    def __init__(self, fpath, threads):
+        self.fpath = fpath
+        self.threads = max(1, threads)
+        self._in_f = open(fpath, 'rb')
+        self._chunks = self._decompressed_chunks()
+        self._buffer = b''
+        self._pos = 0
+
+    def _batches(self):
+        batch = []
+        batch_size = 0
+        while True:
+            block = _read_bgzf_block(self._in_f)
+            if block is None:
+                break
+            batch.append(block)
+            batch_size += len(block)
+            if batch_size >= BATCH_SIZE:
+                yield batch
+                batch = []
+                batch_size = 0
+        if batch:
+            yield batch
+
+    def _decompressed_chunks(self):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            tasks = deque()
+            for batch in self._batches():
+                tasks.append(executor.submit(_decompress_batch, batch))
+                if len(tasks) >= 2 * self.threads:  # keep memory bounded
+                    yield tasks.popleft().result()
+            while tasks:
+                yield tasks.popleft().result()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._buffer):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk
+            self._pos = 0
+        n = min(len(b), len(self._buffer) - self._pos)
+        b[:n] = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._chunks.close()
+            self._in_f.close()
+        super(ParallelGzipReader, self).close()
+
+
+def open_gzip(fpath, mode='rb', threads=None):
+    """
+        Same as gzip.open but BGZF files opened for reading are decompressed in several threads.
+        Inside pool workers the default is a single thread since the pool already uses all max_threads
+    """
+    from quast_libs.qutils import is_pool_process  # qutils imports this module through fastaparser
+    if threads is None:
+        threads = 1 if is_pool_process() else (qconfig.max_threads or 1)
+    if threads < 2 or 'r' not in mode or not is_bgzf(fpath):
+        return gzip.open(fpath, mode=mode)
+    binary_file = io.BufferedReader(ParallelGzipReader(fpath, threads), buffer_size=BATCH_SIZE)
+    if 't' in mode:
+        return io.TextIOWrapper(binary_file)
+    return binary_file
@@ -41,7 +41,7 @@ logarithmic_x_scale = False  # for cumulative plots only
 import math
 import sys
 
-from quast_libs import fastaparser, qconfig, reporting
+from quast_libs import fastaparser, qconfig, reporting, reference_profile
 from quast_libs.log import get_logger, get_main_logger
 from quast_libs.qutils import label_from_fpath, parse_str_to_num, run_parallel
 from quast_libs.plotter_data import get_color_and_ls, colors
@@ -261,7 +261,7 @@ def cumulative_plot(reference, contigs_fpaths, lists_of_lengths, plot_fpath, tit
 
     if reference:
         y_vals = [0]
-        for l in sorted(fastaparser.get_chr_lengths_from_fastafile(reference).values(), reverse=True):
+        for l in sorted(reference_profile.get(reference).chr_lengths.values(), reverse=True):
             y_vals.append(y_vals[-1] + l)
         x_vals = list(range(0, len(y_vals)))
         # extend reference curve to the max X-axis point
@@ -285,7 +285,7 @@ def frc_plot(results_dir, ref_fpath, contigs_fpaths, contigs_aligned_lengths, fe
 
     plots = []
     max_y = 0
-    ref_length = sum(fastaparser.get_chr_lengths_from_fastafile(ref_fpath).values())
+    ref_length = reference_profile.get(ref_fpath).total_length
     json_vals_x = []  # coordinates for Nx-like plots in HTML-report
     json_vals_y = []
     max_features = max(sum(feature_in_contigs) for feature_in_contigs in features_in_contigs_by_file.values()) + 1
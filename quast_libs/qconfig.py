@@ -65,6 +65,7 @@ test_no_ref = False
 no_check = False
 no_check_meta = False  # for metaQUAST, without checking min-contig
 unique_mapping = False  # for metaQUAST only
+reuse_combined_alignments = False  # for metaQUAST only
 no_gc = False
 no_sv = False
 no_read_stats = False
@@ -457,6 +458,8 @@ def usage(show_hidden=False, mode=None, short=True, stream=sys.stdout):
         if meta:
             stream.write("    --unique-mapping                  Disable --ambiguity-usage=all for the combined reference run,\n")
             stream.write("                                      i.e. use user-specified or default ('%s') value of --ambiguity-usage\n" % ambiguity_usage)
+            stream.write("    --reuse-combined-alignments       Do not align contigs again in the runs per reference, use alignments\n")
+            stream.write("                                      to the combined reference split by references instead\n")
         stream.write("    --strict-NA                       Break contigs in any misassembly event when compute NAx and NGAx.\n")
         stream.write("                                      By default, QUAST breaks contigs only by extensive misassemblies (not local ones)\n")
         stream.write("-x  --extensive-mis-size  <int>       Lower threshold for extensive misassembly size. All relocations with inconsistency\n")
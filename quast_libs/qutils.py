@@ -16,6 +16,7 @@ import stat
 import sys
 import re
 from collections import defaultdict
+from multiprocessing import current_process
 from os.path import basename, isfile, isdir, exists, join
 
 try:
@@ -34,6 +35,7 @@ MAX_CONTIG_NAME_GLIMMER = 298   # Glimmer's constraint
 
 external_tools_dirpath = os.path.join(qconfig.QUAST_HOME, 'external_tools')
 blast_dirpath = None
+CHUNKS_PER_THREAD = 4  # parallel stages split their data into more chunks than threads to balance the load
 
 
 def set_up_output_dir(output_dirpath, json_outputpath,
@@ -85,53 +87,110 @@ def set_up_output_dir(output_dirpath, json_outputpath,
     return output_dirpath, json_outputpath, existing_quast_dir
 
 
-def correct_seq(seq, original_fpath):
-    corr_seq = seq.upper()
+# correcting alternatives (gage can't work with alternatives)
+# AMBIGUOUS_BASES_TRANSLATION = str.maketrans('MKRYWSVBHD', 'AGACACACAA')
+AMBIGUOUS_BASES_TRANSLATION = str.maketrans('MKRYWSVBHD', 'N' * 10)
+non_acgtn_pattern = re.compile(r'[^ACGTN]')
+
 
-    # correcting alternatives (gage can't work with alternatives)
-    # dic = {'M': 'A', 'K': 'G', 'R': 'A', 'Y': 'C', 'W': 'A', 'S': 'C', 'V': 'A', 'B': 'C', 'H': 'A', 'D': 'A'}
-    dic = {'M': 'N', 'K': 'N', 'R': 'N', 'Y': 'N', 'W': 'N', 'S': 'N', 'V': 'N', 'B': 'N', 'H': 'N', 'D': 'N'}
-    pat = "(%s)" % "|".join(map(re.escape, dic.keys()))
-    corr_seq = re.sub(pat, lambda m: dic[m.group()], corr_seq)
+def correct_seq(seq, original_fpath):
+    # seq to uppercase, because we later looking only uppercase letters
+    corr_seq = seq.upper().translate(AMBIGUOUS_BASES_TRANSLATION)
 
     # make sure that only A, C, G, T or N are in the sequence
-    if re.compile(r'[^ACGTN]').search(corr_seq):
+    if non_acgtn_pattern.search(corr_seq):
         logger.error('Skipping ' + original_fpath + ' because it contains non-ACGTN characters.', indent='    ')
         return None
     return corr_seq
 
 
+class _CorrectedFasta(object):
+    """
+        Iterable over corrected FASTA entries (name, seq).
+        Iteration stops at the first invalid entry and sets failed, entries counts the yielded entries
+    """
+    def __init__(self, original_fpath, min_contig, is_reference):
+        self.original_fpath = original_fpath
+        self.min_contig = min_contig
+        self.is_reference = is_reference
+        self.failed = False
+        self.entries = 0
+
+    def __iter__(self):
+        used_seq_names = defaultdict(int)
+        for first_line, seq in fastaparser.read_fasta(self.original_fpath):
+            if not first_line:
+                logger.error('Skipping ' + self.original_fpath + ' because >sequence_name field is empty.', indent='    ')
+                self.failed = True
+                return
+            if (len(seq) >= self.min_contig) or self.is_reference:
+                corr_name = correct_name(first_line)
+                uniq_name = get_uniq_name(corr_name, used_seq_names)
+                used_seq_names[corr_name] += 1
+
+                if not qconfig.no_check:
+                    corr_seq = correct_seq(seq, self.original_fpath)
+                    if not corr_seq:
+                        self.failed = True
+                        return
+                else:
+                    if non_acgtn_pattern.search(seq):
+                        logger.error('File ' + self.original_fpath + ' contains non-ACGTN characters. '
+                                     'Please re-run QUAST without --no-check.', indent='    ', exit_with_code=1)
+                        self.failed = True
+                        return
+                    corr_seq = seq
+                self.entries += 1
+                yield uniq_name, corr_seq
+
+    @property
+    def is_correct(self):
+        return not self.failed and self.entries > 0
+
+
 def correct_fasta(original_fpath, min_contig, corrected_fpath=None, is_reference=False):
-    modified_fasta_entries = []
-    used_seq_names = defaultdict(int)
-    for first_line, seq in fastaparser.read_fasta(original_fpath):
-        if not first_line:
-            logger.error('Skipping ' + original_fpath + ' because >sequence_name field is empty.', indent='    ')
-            return False
-        if (len(seq) >= min_contig) or is_reference:
-            corr_name = correct_name(first_line)
-            uniq_name = get_uniq_name(corr_name, used_seq_names)
-            used_seq_names[corr_name] += 1
-
-            if not qconfig.no_check:
-                # seq to uppercase, because we later looking only uppercase letters
-                corr_seq = correct_seq(seq, original_fpath)
-                if not corr_seq:
-                    return False
-            else:
-                if re.compile(r'[^ACGTN]').search(seq):
-                    logger.error('File ' + original_fpath + ' contains non-ACGTN characters. '
-                                 'Please re-run QUAST without --no-check.', indent='    ', exit_with_code=1)
-                    return False
-                corr_seq = seq
-            modified_fasta_entries.append((uniq_name, corr_seq))
-
-    if not modified_fasta_entries:
-        logger.warning('Skipping ' + original_fpath + ' because file is empty.', indent='    ')
-        return False
-    if corrected_fpath:
-        fastaparser.write_fasta(corrected_fpath, modified_fasta_entries)
-    return True
+    """
+        Corrects names and sequences of original_fpath and writes them into corrected_fpath one by one
+    """
+    corrected_fasta = _CorrectedFasta(original_fpath, min_contig, is_reference)
+    # contigs are indexed for random access to their sequences in the later stages
+    return _save_corrected_fasta(corrected_fasta, corrected_fpath, create_fai=not is_reference)
+
+
+def _save_corrected_fasta(corrected_fasta, corrected_fpath, create_fai, entries=None):
+    """
+        Writes entries of corrected_fasta (or of entries, an iterable passing them through) into a temporary file
+        which replaces corrected_fpath only if the whole file is correct (if corrected_fpath is None,
+        the entries are only checked). Returns True if the file is correct
+    """
+    if entries is None:
+        entries = corrected_fasta
+    if not corrected_fpath:
+        for _ in entries:
+            pass
+    else:
+        tmp_fpath = corrected_fpath + '.tmp'
+        is_written = False
+        try:
+            fastaparser.write_fasta(tmp_fpath, entries, create_fai=create_fai)
+            if corrected_fasta.is_correct:
+                os.rename(tmp_fpath, corrected_fpath)
+                if create_fai:
+                    os.rename(tmp_fpath + '.fai', corrected_fpath + '.fai')
+                is_written = True
+        finally:
+            if not is_written:
+                _remove_fasta_with_fai(tmp_fpath)
+
+    if not corrected_fasta.failed and not corrected_fasta.entries:
+        logger.warning('Skipping ' + corrected_fasta.original_fpath + ' because file is empty.', indent='    ')
+    return corrected_fasta.is_correct
+
+
+def _remove_fasta_with_fai(fasta_fpath):
+    for fpath in [fasta_fpath, fasta_fpath + '.fai']:
+        if os.path.isfile(fpath):
+            os.remove(fpath)
 
 
 # Correcting fasta and reporting stats
@@ -236,67 +295,100 @@ def parallel_correct_contigs(file_counter, contigs_fpath, corrected_dirpath, lab
     is_fatal_error = False
 
     corr_fpath = unique_corrected_fpath(os.path.join(corrected_dirpath, slugify(label) + fasta_ext))
+    # if option --scaffolds is specified QUAST adds split version of assemblies to the comparison
+    need_splitting = qconfig.split_scaffolds and not qconfig.is_combined_ref
+    broken_scaffolds_fpath = None
+    broken_logs = []
     lengths = get_lengths_from_fasta(contigs_fpath, label)
     if not lengths:
         corr_fpath = None
-    elif qconfig.no_check_meta:
-        if not correct_fasta(contigs_fpath, qconfig.min_contig):
+    else:
+        if qconfig.no_check_meta:
+            # contigs are only checked, corrected file is not written
+            dst_fpath = None
+        else:
+            dst_fpath = corr_fpath
+        if need_splitting:
+            is_corrected, broken_scaffolds_fpath, broken_logs = \
+                correct_and_break_scaffolds(file_counter, labels, contigs_fpath, dst_fpath, corrected_dirpath)
+        else:
+            is_corrected = correct_fasta(contigs_fpath, qconfig.min_contig, dst_fpath)
+        if not is_corrected:
             corr_fpath = None
             is_fatal_error = True
-        else:
+        elif qconfig.no_check_meta:
             corr_fpath = contigs_fpath
-    elif not correct_fasta(contigs_fpath, qconfig.min_contig, corr_fpath):
-        corr_fpath = None
-        is_fatal_error = True
     if corr_fpath:
         corr_fpaths.append((corr_fpath, lengths))
         old_contigs_fpaths.append(contigs_fpath)
         logs.append('  ' + index_to_str(file_counter, force=(len(labels) > 1)) + '%s ==> %s' % (contigs_fpath, label))
+        logs.extend(broken_logs)
 
-    # if option --scaffolds is specified QUAST adds split version of assemblies to the comparison
-    if qconfig.split_scaffolds and not qconfig.is_combined_ref and corr_fpath:
-        broken_scaffold_fpath, logs = broke_scaffolds(file_counter, labels, corr_fpath, corrected_dirpath, logs)
-        if broken_scaffold_fpath:
-            lengths = get_lengths_from_fasta(broken_scaffold_fpath, label + '_broken')
-            if lengths and (qconfig.no_check_meta or correct_fasta(contigs_fpath, qconfig.min_contig, corr_fpath)):
-                broken_scaffold_fpaths.append((broken_scaffold_fpath, lengths))
-                qconfig.dict_of_broken_scaffolds[broken_scaffold_fpath] = corr_fpath
+    if broken_scaffolds_fpath:
+        lengths = get_lengths_from_fasta(broken_scaffolds_fpath, label + '_broken')
+        if lengths:
+            broken_scaffold_fpaths.append((broken_scaffolds_fpath, lengths))
+            qconfig.dict_of_broken_scaffolds[broken_scaffolds_fpath] = corr_fpath
 
     return old_contigs_fpaths, corr_fpaths, broken_scaffold_fpaths, logs, is_fatal_error
 
 
-def broke_scaffolds(file_counter, labels, contigs_fpath, corrected_dirpath, logs):
-    logs.append('  ' + index_to_str(file_counter, force=(len(labels) > 1)) + '  breaking scaffolds into contigs:')
-    contigs_fname = os.path.basename(contigs_fpath)
-    fname, fasta_ext = splitext_for_fasta_file(contigs_fname)
-    label = labels[file_counter]
-    corr_fpath = unique_corrected_fpath(os.path.join(corrected_dirpath, slugify(label) + fasta_ext))
-    corr_fpath_wo_ext = os.path.join(corrected_dirpath, name_from_fpath(corr_fpath))
-    broken_scaffolds_fpath = corr_fpath_wo_ext + '_broken' + fasta_ext
-    broken_scaffolds_fasta = []
-    contigs_counter = 0
+class _BrokenScaffolds(object):
+    """
+        Iterable passing corrected entries through and writing them split by Ns into broken_writer,
+        broken_contigs counts the resulting contigs
+    """
+    def __init__(self, corrected_entries, broken_writer):
+        self.corrected_entries = corrected_entries
+        self.broken_writer = broken_writer
+        self.broken_contigs = 0
 
-    scaffold_counter = 0
-    for scaffold_counter, (name, seq) in enumerate(fastaparser.read_fasta(contigs_fpath)):
-        if contigs_counter % 100 == 0:
-            pass
-        if contigs_counter > 520:
-            pass
-        total_contigs_for_the_scaf = split_by_ns(seq, name, broken_scaffolds_fasta, qconfig.Ns_break_threshold, qconfig.min_contig)
-        contigs_counter += total_contigs_for_the_scaf
-    if contigs_counter > scaffold_counter + 1:
-        fastaparser.write_fasta(broken_scaffolds_fpath, broken_scaffolds_fasta)
+    def __iter__(self):
+        for name, seq in self.corrected_entries:
+            broken_contigs = []
+            self.broken_contigs += split_by_ns(seq, name, broken_contigs, qconfig.Ns_break_threshold, qconfig.min_contig)
+            for contig_name, contig_seq in broken_contigs:
+                self.broken_writer.write(contig_name, contig_seq)
+            yield name, seq
+
+
+def correct_and_break_scaffolds(file_counter, labels, contigs_fpath, corr_fpath, corrected_dirpath):
+    """
+        Same as correct_fasta but scaffolds are also broken into contigs by Ns in the same pass.
+        Returns whether the file is correct, path to the broken scaffolds (None if nothing was broken) and log lines
+    """
+    label = labels[file_counter]
+    _, fasta_ext = splitext_for_fasta_file(os.path.basename(contigs_fpath))
+    logs = ['  ' + index_to_str(file_counter, force=(len(labels) > 1)) + '  breaking scaffolds into contigs:']
+    tmp_broken_fpath = os.path.join(corrected_dirpath, slugify(label) + '_broken.tmp')
+    corrected_fasta = _CorrectedFasta(contigs_fpath, qconfig.min_contig, False)
+    broken_writer = fastaparser.FastaWriter(tmp_broken_fpath, create_fai=True)
+    try:
+        broken_scaffolds = _BrokenScaffolds(corrected_fasta, broken_writer)
+        is_corrected = _save_corrected_fasta(corrected_fasta, corr_fpath, create_fai=True, entries=broken_scaffolds)
+    finally:
+        broken_writer.close()
+    scaffolds_num, contigs_num = corrected_fasta.entries, broken_scaffolds.broken_contigs
+    if not is_corrected or contigs_num <= scaffolds_num:
+        _remove_fasta_with_fai(tmp_broken_fpath)
+        if not is_corrected:
+            return False, None, []
         logs.append("  " + index_to_str(file_counter, force=(len(labels) > 1)) +
-                    "    %d scaffolds (%s) were broken into %d contigs (%s)" %
-                    (scaffold_counter + 1,
-                     label,
-                     contigs_counter,
-                     label + '_broken'))
-        return broken_scaffolds_fpath, logs
+                    "    WARNING: nothing was broken, skipping '%s broken' from further analysis" % label)
+        return True, None, logs
 
+    corr_fpath_wo_ext = os.path.join(corrected_dirpath, name_from_fpath(
+        unique_corrected_fpath(os.path.join(corrected_dirpath, slugify(label) + fasta_ext))))
+    broken_scaffolds_fpath = corr_fpath_wo_ext + '_broken' + fasta_ext
+    os.rename(tmp_broken_fpath, broken_scaffolds_fpath)
+    os.rename(tmp_broken_fpath + '.fai', broken_scaffolds_fpath + '.fai')
     logs.append("  " + index_to_str(file_counter, force=(len(labels) > 1)) +
-                "    WARNING: nothing was broken, skipping '%s broken' from further analysis" % label)
-    return None, logs
+                "    %d scaffolds (%s) were broken into %d contigs (%s)" %
+                (scaffolds_num,
+                 label,
+                 contigs_num,
+                 label + '_broken'))
+    return True, broken_scaffolds_fpath, logs
 
 
 def split_by_ns(seq, name, splitted_fasta, Ns_break_threshold=1, min_contig=1, total_contigs=0):
@@ -648,6 +740,24 @@ def get_free_memory():
     return min(total_mem // 4, free_mem // 2)
 
 
+def get_available_memory():
+    """
+        Returns memory (in GB, not rounded) that can be used without swapping, i.e. MemAvailable that
+        also counts reclaimable page cache, or None if it is unknown
+    """
+    if qconfig.platform_name != 'linux_64':
+        return None
+    try:
+        with open('/proc/meminfo') as mem:
+            for line in mem:
+                fields = line.split()
+                if fields[0] == 'MemAvailable:':
+                    return int(fields[1]) / 1024 / 1024
+    except (IOError, ValueError, IndexError):
+        pass
+    return None
+
+
 def get_chr_len_fpath(ref_fpath, correct_chr_names=None):
     chr_len_fpath = ref_fpath + '.fai'
     raw_chr_names = dict((raw_name, correct_name) for correct_name, raw_name in correct_chr_names.items()) \
@@ -1037,6 +1147,34 @@ def download_external_tool(fname, dirpath, tool, platform_specific=False, is_exe
     return downloaded_fpath
 
 
+def is_pool_process():
+    """
+        Processes of a pool can not start their own pools, so parallel stages fall back to serial in them
+    """
+    return current_process().daemon
+
+
+def split_into_chunks(items, chunks_num, size=len):
+    """
+        Splits items into at most chunks_num consecutive chunks of approximately the same total size
+        (e.g. contigs by lengths), so the results of chunks can be concatenated in the original order.
+        Returns an empty list if there are no items
+    """
+    items = list(items)
+    if not items:
+        return []
+    chunks_num = max(1, chunks_num)
+    chunk_size = sum(size(item) for item in items) / chunks_num
+    chunks = [[]]
+    cur_size = 0
+    for item in items:
+        if chunks[-1] and len(chunks) < chunks_num and cur_size >= chunk_size * len(chunks):
+            chunks.append([])
+        chunks[-1].append(item)
+        cur_size += size(item)
+    return chunks
+
+
 def run_parallel(_fn, fn_args, n_jobs=None, filter_results=False):
     if qconfig.memory_efficient:
         results_tuples = [_fn(*args) for args in fn_args]
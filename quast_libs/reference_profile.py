@@ -0,0 +1,176 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Reference profile: everything QUAST stages need to know about the reference
+# (chromosome names and lengths, runs of Ns, GC content) collected in a single
+# pass through the FASTA file.
+#
+############################################################################
+
+from __future__ import with_statement
+from __future__ import division
+import os
+import pickle
+from array import array
+from collections import defaultdict
+from math import gcd
+
+try:
+   from collections import OrderedDict
+except ImportError:
+   from quast_libs.site_packages.ordered_dict import OrderedDict
+
+from quast_libs import fastaparser, qconfig
+from quast_libs.log import get_logger
+from quast_libs.qutils import md5
+
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+PROFILE_VERSION = 1
+GC_DISTRIBUTION_WINDOW_SIZE = 100  # windows used for the GC content plot
+profiles_by_fpath = {}
+
+
+class ReferenceProfile(object):
+    def __init__(self, md5=None, window_sizes=None):
+        self.version = PROFILE_VERSION
+        self.md5 = md5
+        self.chr_lengths = OrderedDict()
+        self.ns_by_chromosomes = OrderedDict()  # chr_name --> sorted list of (start, end) runs of Ns
+        self.ACGT_len = 0
+        self.GC_len = 0
+        # (ACGT len, GC len) --> number of non-overlapping windows of GC_DISTRIBUTION_WINDOW_SIZE
+        self.GC_windows_histogram = defaultdict(int)
+        # window size --> chr_name --> (ACGT lens, GC lens) of non-overlapping windows
+        self.GC_windows = dict((window_size, OrderedDict()) for window_size in (window_sizes or []))
+
+    @property
+    def total_length(self):
+        return sum(self.chr_lengths.values())
+
+    @property
+    def total_GC(self):
+        if not self.ACGT_len:
+            return None
+        return self.GC_len * 100.0 / self.ACGT_len
+
+    def get_genome_stats(self, skip_ns=False):
+        """
+            Same as fastaparser.get_genome_stats but without reading the reference
+        """
+        genome_size = self.total_length
+        if skip_ns:
+            genome_size -= sum(fastaparser.get_ns_count(ns_intervals) for ns_intervals in self.ns_by_chromosomes.values())
+        return genome_size, dict(self.chr_lengths), self.ns_by_chromosomes
+
+    def has_windows(self, window_sizes):
+        return all(window_size in self.GC_windows for window_size in window_sizes)
+
+
+def get_icarus_window_size():
+    return qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size
+
+
+def _merge_windows(lens, factor):
+    if factor == 1:
+        return lens
+    return array('L', (sum(lens[i:i + factor]) for i in range(0, len(lens), factor)))
+
+
+def _compute(ref_fpath, ref_md5=None):
+    from quast_libs.circos import WINDOW_SIZES, DEFAULT_WINDOW_SIZE, set_window_size
+
+    # Circos window size depends on the total reference length which is unknown until the end of the file,
+    # so all candidate sizes are collected and the ones that became too small are dropped on the way
+    circos_window_sizes = set([DEFAULT_WINDOW_SIZE] + [window_size for _, window_size in WINDOW_SIZES])
+    required_window_sizes = set([get_icarus_window_size()])
+    window_sizes = required_window_sizes | circos_window_sizes
+    base_window_size = GC_DISTRIBUTION_WINDOW_SIZE
+    for window_size in window_sizes:
+        base_window_size = gcd(base_window_size, window_size)
+
+    profile = ReferenceProfile(ref_md5, window_sizes)
+    for name, seq in fastaparser.read_fasta_bytes(ref_fpath):
+        chr_name = name.split()[0]
+        profile.chr_lengths[chr_name] = len(seq)
+        profile.ns_by_chromosomes[chr_name] = fastaparser.get_ns_intervals(seq)
+        ACGT_lens, GC_lens = fastaparser.count_GC_in_windows(seq, base_window_size)
+        profile.ACGT_len += sum(ACGT_lens)
+        profile.GC_len += sum(GC_lens)
+
+        factor = GC_DISTRIBUTION_WINDOW_SIZE // base_window_size
+        for ACGT_len, GC_len in zip(_merge_windows(ACGT_lens, factor), _merge_windows(GC_lens, factor)):
+            profile.GC_windows_histogram[(ACGT_len, GC_len)] += 1
+        for window_size, windows in profile.GC_windows.items():
+            factor = window_size // base_window_size
+            windows[chr_name] = (_merge_windows(ACGT_lens, factor), _merge_windows(GC_lens, factor))
+
+        min_circos_window_size = set_window_size(profile.total_length)
+        for window_size in list(profile.GC_windows.keys()):
+            if window_size < min_circos_window_size and window_size not in required_window_sizes:
+                del profile.GC_windows[window_size]
+    profile.GC_windows_histogram = dict(profile.GC_windows_histogram)
+    return profile
+
+
+def _load(profile_fpath, ref_md5, window_sizes):
+    try:
+        with open(profile_fpath, 'rb') as profile_f:
+            profile = pickle.load(profile_f)
+    except Exception:
+        return None
+    if getattr(profile, 'version', None) != PROFILE_VERSION or profile.md5 != ref_md5 or not profile.has_windows(window_sizes):
+        return None
+    return profile
+
+
+def _get_profile_fpath(ref_fpath, dirpath):
+    return os.path.join(dirpath, os.path.basename(ref_fpath) + '.profile')
+
+
+def create(ref_fpath, corrected_dirpath):
+    """
+        Reads reference profile saved next to the corrected reference (if it matches the reference md5)
+        or computes it. Registers the profile for ref_fpath so get() does not read the reference again.
+    """
+    profile_fpath = _get_profile_fpath(ref_fpath, corrected_dirpath)
+    ref_md5 = md5(ref_fpath)
+    profile = None
+    if os.path.isfile(profile_fpath):
+        profile = _load(profile_fpath, ref_md5, [get_icarus_window_size()])
+        if profile is not None:
+            logger.info('  Using existing reference profile ' + profile_fpath)
+    if profile is None:
+        profile = _compute(ref_fpath, ref_md5)
+        try:
+            with open(profile_fpath, 'wb') as profile_f:
+                pickle.dump(profile, profile_f, pickle.HIGHEST_PROTOCOL)
+        except IOError:
+            logger.warning('Failed to save reference profile to ' + profile_fpath)
+    profiles_by_fpath[ref_fpath] = profile
+    return profile
+
+
+def get(ref_fpath):
+    """
+        Returns the profile registered by create() or obtained by an earlier call in this process.
+        Processes without the registry load the profile saved by create() next to the corrected reference.
+        Otherwise the profile is computed here (an extra pass through the reference, so it is reported) and cached
+    """
+    window_sizes = [get_icarus_window_size()]
+    profile = profiles_by_fpath.get(ref_fpath)
+    if profile is None or not profile.has_windows(window_sizes):
+        profile = None
+        profile_fpath = _get_profile_fpath(ref_fpath, os.path.dirname(ref_fpath))
+        if os.path.isfile(profile_fpath):
+            profile = _load(profile_fpath, md5(ref_fpath), window_sizes)
+        if profile is None:
+            logger.warning('Reference profile of ' + ref_fpath + ' was not prepared in advance, '
+                           'reading the reference again')
+            profile = _compute(ref_fpath)
+        profiles_by_fpath[ref_fpath] = profile
+    return profile
@@ -13,9 +13,9 @@ import shutil
 from collections import defaultdict
 from os.path import join, abspath, exists, basename, isdir
 
-from quast_libs import qconfig, reporting, qutils
+from quast_libs import qconfig, reporting, qutils, reference_profile
 from quast_libs.ca_utils.misc import compile_minimap, minimap_fpath
-from quast_libs.fastaparser import read_fasta
+from quast_libs.fastaparser import read_fasta, get_chr_lengths_from_fastafile
 from quast_libs.qutils import get_free_memory, md5, download_external_tool, \
     get_dir_for_download
 from quast_libs.reporting import save_kmers
@@ -253,7 +253,7 @@ def do(output_dir, ref_fpath, contigs_fpaths, logger):
         kmc_out_fpaths.append(intersect_out_fpath)
 
     logger.info('  Analyzing assemblies correctness...')
-    ref_contigs = [name for name, _ in read_fasta(ref_fpath)]
+    ref_contigs = list(reference_profile.get(ref_fpath).chr_lengths.keys())
     logger.info('    Downsampling k-mers...')
     ref_kmers, downsampled_kmers_fpath = downsample_kmers(tmp_dirpath, ref_fpath, ref_kmc_out_fpath, kmer_len, log_fpath, err_fpath)
     for id, (contigs_fpath, kmc_db_fpath) in enumerate(zip(contigs_fpaths, kmc_out_fpaths)):
@@ -267,9 +267,9 @@ def do(output_dir, ref_fpath, contigs_fpaths, logger):
         translocations, relocations = None, None
         total_len = 0
         contig_lens = dict()
-        for name, seq in read_fasta(contigs_fpath):
-            total_len += len(seq)
-            contig_lens[name] = len(seq)
+        for name, seq_len in get_chr_lengths_from_fastafile(contigs_fpath).items():
+            total_len += seq_len
+            contig_lens[name] = seq_len
 
         if len(ref_contigs) > MAX_REF_CONTIGS_NUM:
             logger.warning('Reference is too fragmented. Scaffolding accuracy will not be assessed.')
@@ -0,0 +1,21 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Unit tests of pure helpers: run with  python -m pytest tests
+#
+############################################################################
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quast_libs import qconfig
+
+# some modules use it at import time, it is normally set while parsing options
+if qconfig.extensive_misassembly_threshold is None:
+    qconfig.extensive_misassembly_threshold = qconfig.DEFAULT_EXT_MIS_SIZE
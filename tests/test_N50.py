@@ -0,0 +1,49 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+import random
+import unittest
+
+from quast_libs import N50
+
+
+def expanded_x_max(runs, total_length):
+    values = sorted([value for value, run_length in runs for _ in range(run_length)], reverse=True)
+    values += [0] * (total_length - len(values))
+    return [values[len(values) * x // 100] for x in range(100)] + [values[-1]]
+
+
+class WeightedPercentilesTest(unittest.TestCase):
+    def test_same_as_expanded_list(self):
+        rnd = random.Random(0)
+        for _ in range(200):
+            runs = [(rnd.randint(0, 50), rnd.randint(1, 20)) for _ in range(rnd.randint(1, 10))]
+            total_length = sum(run_length for _, run_length in runs) + rnd.randint(0, 30)
+            self.assertEqual(N50.weighted_percentiles(runs, total_length), expanded_x_max(runs, total_length))
+
+    def test_uncovered_bases_are_zeros(self):
+        x_max = N50.weighted_percentiles([(10, 50)], 100)
+        self.assertEqual(x_max[0], 10)
+        self.assertEqual(x_max[49], 10)
+        self.assertEqual(x_max[50], 0)
+        self.assertEqual(x_max[100], 0)
+
+    def test_equal_values_are_merged(self):
+        self.assertEqual(N50.weighted_percentiles([(5, 1), (7, 2), (5, 1)]),
+                         N50.weighted_percentiles([(7, 2), (5, 2)]))
+
+    def test_mean_and_fractions(self):
+        runs = [(10000, 30), (4000, 50)]
+        x_max, mean_max, (p5k, p10k) = N50.weighted_x_max_stats(runs, 100, [5000, 10000])
+        self.assertEqual(mean_max, (10000 * 30 + 4000 * 50) // 100)
+        self.assertEqual(N50.weighted_mean(runs, 100), mean_max)
+        self.assertAlmostEqual(p5k, 0.3)
+        self.assertAlmostEqual(p10k, 0.3)
+        self.assertAlmostEqual(N50.weighted_fraction_not_less(runs, 4000, 100), 0.8)
+
+    def test_runs_longer_than_total_length(self):
+        self.assertRaises(AssertionError, N50.weighted_percentiles, [(1, 10)], 5)
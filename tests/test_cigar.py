@@ -0,0 +1,45 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+import unittest
+
+from quast_libs.ca_utils.cigar import parse_cs_tag, iter_cs_ops, count_cs_ops, iter_cigar_ops, \
+    CS_MATCH, CS_MISMATCH, CS_INSERTION, CS_DELETION
+
+
+class CsTagTest(unittest.TestCase):
+    cs = ':10*ag:1500+tt-c:3*an'
+
+    def test_parse_cs_tag(self):
+        self.assertEqual(parse_cs_tag(self.cs), [':10', '*ag', ':1500', '+tt', '-c', ':3', '*an'])
+        self.assertEqual(parse_cs_tag(''), [])
+
+    def test_iter_cs_ops(self):
+        self.assertEqual(list(iter_cs_ops(self.cs)),
+                         [(CS_MATCH, 10, None), (CS_MISMATCH, 1, 'ag'), (CS_MATCH, 1500, None), (CS_INSERTION, 2, 'tt'),
+                          (CS_DELETION, 1, 'c'), (CS_MATCH, 3, None), (CS_MISMATCH, 1, 'an')])
+
+    def test_count_cs_ops(self):
+        # mismatches involving Ns are not counted
+        self.assertEqual(count_cs_ops(self.cs), (1, 2, 1, [2, 1]))
+        self.assertEqual(count_cs_ops(':100'), (0, 0, 0, []))
+
+    def test_count_same_as_ops(self):
+        cs = ':5-acg:2*ct*gn+a:7+ccc*ta'
+        ops = list(iter_cs_ops(cs))
+        mismatches, insertions, deletions, indels = count_cs_ops(cs)
+        self.assertEqual(mismatches, sum(1 for op, _, bases in ops if op == CS_MISMATCH and 'n' not in bases))
+        self.assertEqual(insertions, sum(n for op, n, _ in ops if op == CS_INSERTION))
+        self.assertEqual(deletions, sum(n for op, n, _ in ops if op == CS_DELETION))
+        self.assertEqual(indels, [n for op, n, _ in ops if op in (CS_INSERTION, CS_DELETION)])
+
+
+class CigarTest(unittest.TestCase):
+    def test_iter_cigar_ops(self):
+        self.assertEqual(list(iter_cigar_ops('5S100M2I3D10=1X7H')),
+                         [('S', 5), ('M', 100), ('I', 2), ('D', 3), ('=', 10), ('X', 1), ('H', 7)])
+        self.assertEqual(list(iter_cigar_ops('')), [])
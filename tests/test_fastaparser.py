@@ -0,0 +1,161 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+
+from quast_libs import fastaparser
+
+
+class FastaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.read_block_size = fastaparser.READ_BLOCK_SIZE
+
+    def tearDown(self):
+        fastaparser.READ_BLOCK_SIZE = self.read_block_size
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, text, fname='test.fasta'):
+        fpath = os.path.join(self.tmp_dir, fname)
+        if fname.endswith('.gz'):
+            with gzip.open(fpath, 'wb') as out_f:
+                out_f.write(text.encode())
+        else:
+            with open(fpath, 'w', newline='') as out_f:
+                out_f.write(text)
+        return fpath
+
+
+class ReadFastaBytesTest(FastaTestCase):
+    def assert_same_as_read_fasta(self, fpath):
+        expected = list(fastaparser.read_fasta(fpath))
+        for block_size in [1, 2, 3, 5, 16, 1 << 20]:  # entries, headers and line ends split by block boundaries
+            fastaparser.READ_BLOCK_SIZE = block_size
+            self.assertEqual([(name, seq.decode()) for name, seq in fastaparser.read_fasta_bytes(fpath)], expected)
+            self.assertEqual(list(fastaparser.read_fasta_stats(fpath)),
+                             [(name, len(seq), seq.count('N')) for name, seq in expected])
+
+    def test_line_ends(self):
+        for line_end in ['\n', '\r\n', '\r']:
+            text = line_end.join(['>ctg1 description', 'ACGTN', 'NNAC', '>ctg2', '', 'GGG', '>ctg3', 'TT']) + line_end
+            self.assert_same_as_read_fasta(self.write_file(text))
+
+    def test_greater_than_sign_inside_lines(self):
+        # '>' starts an entry only at the beginning of a line
+        text = '>ctg1 a>b\nAC>GT\nA>\n>ctg2\n>ctg3\nTT>\n'
+        self.assert_same_as_read_fasta(self.write_file(text))
+        fastaparser.READ_BLOCK_SIZE = 1
+        self.assertEqual([name for name, _ in fastaparser.read_fasta_bytes(self.write_file(text))],
+                         ['ctg1', 'ctg2', 'ctg3'])
+
+    def test_no_final_line_end(self):
+        self.assert_same_as_read_fasta(self.write_file('>ctg1\nACGT\n>ctg2\nGG'))
+        self.assert_same_as_read_fasta(self.write_file('>ctg1\nACGT\n>ctg2'))
+
+    def test_compressed(self):
+        self.assert_same_as_read_fasta(self.write_file('>ctg1\r\nACGT\r\n>ctg2\r\nNNG\r\n', 'test.fasta.gz'))
+
+    def test_many_short_entries(self):
+        # parsing must stay linear in the number of entries (line ends used to be searched to the end of a block)
+        fpath = self.write_file(''.join('>ctg%d\n%s\n' % (i, 'ACGT' * 20) for i in range(50000)))
+        start_time = time.time()
+        self.assertEqual(sum(1 for _ in fastaparser.read_fasta(fpath)), 50000)
+        read_fasta_time = time.time() - start_time
+        start_time = time.time()
+        self.assertEqual(sum(1 for _ in fastaparser.read_fasta_stats(fpath)), 50000)
+        self.assertLess(time.time() - start_time, 10 * read_fasta_time + 1)
+
+    def test_random_files(self):
+        rnd = random.Random(0)
+        for _ in range(100):
+            line_end = rnd.choice(['\n', '\r\n', '\r'])
+            text = ''
+            for i in range(rnd.randint(1, 5)):
+                seq = ''.join(rnd.choice('ACGTN>') for _ in range(rnd.randint(0, 100)))
+                width = rnd.randint(1, 30)
+                lines = [seq[j:j + width] for j in range(0, len(seq), width)]
+                lines = ['A' + line if line.startswith('>') else line for line in lines]
+                text += '>ctg%d%s' % (i, rnd.choice(['', ' x>y'])) + line_end + line_end.join(lines) + line_end
+            self.assert_same_as_read_fasta(self.write_file(text))
+
+
+class FastaWriterTest(FastaTestCase):
+    entries = [('ctg1 description', 'ACGT' * 30), ('ctg2', 'A' * 60), ('ctg3', 'C' * 61), ('ctg4', ''),
+               ('ctg_é', 'G' * 7)]  # offsets are in bytes
+
+    def test_fai_same_as_indexed_file(self):
+        fpath = os.path.join(self.tmp_dir, 'written.fasta')
+        fastaparser.write_fasta(fpath, self.entries, create_fai=True)
+        with open(fpath + '.fai') as fai_f:
+            written_fai = fai_f.read()
+        fastaparser.create_fai_file(fpath)
+        with open(fpath + '.fai') as fai_f:
+            self.assertEqual(written_fai, fai_f.read())
+
+    def test_no_fai_when_appending(self):
+        fpath = os.path.join(self.tmp_dir, 'written.fasta')
+        fastaparser.write_fasta(fpath, self.entries[:1], mode='a', create_fai=True)
+        self.assertFalse(os.path.exists(fpath + '.fai'))
+
+    def test_compressed_file_index_is_not_used(self):
+        fpath = self.write_file('>ctg1\nACGT\n', 'test.fasta.gz')
+        with open(fpath + '.fai', 'w') as out_f:  # e.g. made by samtools faidx for bgzip
+            out_f.write('ctg1\t4\t6\t4\t5\n')
+        self.assertIsNone(fastaparser.get_fasta_index(fpath))
+        self.assertIsNone(fastaparser.get_fasta_index(fpath, create=True))
+        self.assertEqual(list(fastaparser.get_chr_lengths_from_fastafile(fpath).items()), [('ctg1', 4)])
+
+
+class FastaIndexTest(FastaTestCase):
+    def setUp(self):
+        super(FastaIndexTest, self).setUp()
+        rnd = random.Random(0)
+        self.seqs = [('ctg1', ''.join(rnd.choice('ACGTN') for _ in range(250))), ('ctg2', 'ACG'), ('ctg3', 'T' * 60)]
+        # not 60 bases per line and CRLF line ends, as in an index made by samtools faidx
+        self.fpath = self.write_file(''.join('>%s desc\r\n' % name + ''.join(seq[i:i + 70] + '\r\n' for i in range(0, len(seq), 70))
+                                             for name, seq in self.seqs))
+        fastaparser.create_fai_file(self.fpath)
+
+    def test_fetch(self):
+        with fastaparser.get_fasta_index(self.fpath) as index:
+            self.assertEqual(list(index.lengths().items()), [(name, len(seq)) for name, seq in self.seqs])
+            for name, seq in self.seqs:
+                self.assertEqual(index.fetch(name), seq)
+                for start in range(0, len(seq) + 2, 7):
+                    for end in range(start, len(seq) + 3, 11):
+                        self.assertEqual(index.fetch(name, start, end), seq[start:end])
+
+    def test_iteration_same_as_read_fasta(self):
+        with fastaparser.get_fasta_index(self.fpath) as index:
+            self.assertEqual(list(index), list(fastaparser.read_fasta(self.fpath)))
+
+    def test_lazy_sequence(self):
+        with fastaparser.get_fasta_index(self.fpath) as index:
+            lazy_seq, seq = index.sequence('ctg1'), self.seqs[0][1]
+            self.assertEqual(len(lazy_seq), len(seq))
+            self.assertEqual(lazy_seq[10:130], seq[10:130])
+            self.assertEqual(lazy_seq[-1], seq[-1])
+            self.assertEqual(lazy_seq.count('N'), seq.count('N'))
+            self.assertRaises(IndexError, lambda: lazy_seq[len(seq)])
+
+    def test_mapped_again_after_close(self):
+        index = fastaparser.get_fasta_index(self.fpath)
+        self.assertEqual(index.fetch('ctg2'), 'ACG')
+        index.close()
+        self.assertEqual(index.fetch('ctg2', 1), 'CG')
+        self.assertIsNone(index.__getstate__()['_mapped_file'])
+        index.close()
+
+    def test_outdated_index_is_not_used(self):
+        os.utime(self.fpath + '.fai', (0, 0))
+        self.assertIsNone(fastaparser.get_fasta_index(self.fpath))
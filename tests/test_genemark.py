@@ -0,0 +1,43 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from quast_libs import fastaparser, genemark
+
+
+class SplitFastaIntoChunksTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.min_chunk_length = genemark.MIN_CHUNK_LENGTH
+        genemark.MIN_CHUNK_LENGTH = 100
+        self.fasta_fpath = os.path.join(self.tmp_dir, 'contigs.fasta')
+        self.contigs = [('ctg%d' % i, 'ACGT' * length) for i, length in enumerate([100, 10, 10, 30, 50, 25, 25, 1])]
+        fastaparser.write_fasta(self.fasta_fpath, self.contigs)
+
+    def tearDown(self):
+        genemark.MIN_CHUNK_LENGTH = self.min_chunk_length
+        shutil.rmtree(self.tmp_dir)
+
+    def test_consecutive_contigs(self):
+        for max_chunks in range(2, 10):
+            chunk_fpaths = genemark.split_fasta_into_chunks(self.fasta_fpath, self.tmp_dir, max_chunks)
+            self.assertTrue(2 <= len(chunk_fpaths) <= max_chunks)
+            self.assertEqual([entry for fpath in chunk_fpaths for entry in fastaparser.read_fasta(fpath)], self.contigs)
+
+    def test_similar_lengths(self):
+        chunk_fpaths = genemark.split_fasta_into_chunks(self.fasta_fpath, self.tmp_dir, 2)
+        self.assertEqual([[name for name, _ in fastaparser.read_fasta(fpath)] for fpath in chunk_fpaths],
+                         [['ctg0', 'ctg1', 'ctg2', 'ctg3'], ['ctg4', 'ctg5', 'ctg6', 'ctg7']])  # 600 and 404 bp
+
+    def test_not_split(self):
+        self.assertEqual(genemark.split_fasta_into_chunks(self.fasta_fpath, self.tmp_dir, 1), [self.fasta_fpath])
+        genemark.MIN_CHUNK_LENGTH = 1000  # assembly is shorter than two chunks
+        self.assertEqual(genemark.split_fasta_into_chunks(self.fasta_fpath, self.tmp_dir, 8), [self.fasta_fpath])
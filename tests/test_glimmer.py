@@ -0,0 +1,36 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+import random
+import unittest
+
+from quast_libs.glimmer import split_contigs_into_batches
+
+
+class SplitContigsIntoBatchesTest(unittest.TestCase):
+    def test_every_contig_in_one_batch(self):
+        rnd = random.Random(0)
+        for _ in range(200):
+            contig_lengths = [('ctg%d' % i, rnd.randint(1, 10000)) for i in range(rnd.randint(1, 40))]
+            batches_num = rnd.randint(1, 10)
+            batches = split_contigs_into_batches(contig_lengths, batches_num)
+            self.assertTrue(1 <= len(batches) <= batches_num)
+            self.assertEqual(sorted(contig for batch in batches for contig in batch), list(enumerate(name for name, _ in contig_lengths)))
+            self.assertTrue(all(batch == sorted(batch) for batch in batches))
+            # the longest contig is placed first, so a batch is never longer than the average one plus a contig
+            lengths = dict(contig_lengths)
+            batches_lengths = [sum(lengths[name] for _, name in batch) for batch in batches]
+            max_length = max(length for _, length in contig_lengths)
+            self.assertLessEqual(max(batches_lengths), sum(batches_lengths) / batches_num + max_length)
+
+    def test_balanced(self):
+        batches = split_contigs_into_batches([('a', 5), ('b', 5), ('c', 10)], 2)
+        self.assertEqual(sorted(batches), [[(0, 'a'), (1, 'b')], [(2, 'c')]])
+
+    def test_fewer_contigs_than_batches(self):
+        self.assertEqual(split_contigs_into_batches([('a', 5)], 4), [[(0, 'a')]])
+        self.assertEqual(split_contigs_into_batches([], 4), [])
@@ -0,0 +1,34 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+import random
+import unittest
+
+from quast_libs.qutils import split_into_chunks
+
+
+class SplitIntoChunksTest(unittest.TestCase):
+    def test_order_and_number_of_chunks(self):
+        rnd = random.Random(0)
+        for _ in range(200):
+            items = [rnd.randint(0, 1000) for _ in range(rnd.randint(1, 50))]
+            chunks_num = rnd.randint(1, 20)
+            chunks = split_into_chunks(items, chunks_num, size=lambda item: item)
+            self.assertEqual([item for chunk in chunks for item in chunk], items)
+            self.assertTrue(1 <= len(chunks) <= chunks_num)
+            self.assertTrue(all(chunks))
+
+    def test_balanced_by_size(self):
+        chunks = split_into_chunks(['a' * 10] * 4 + ['b' * 40], 2)
+        self.assertEqual(chunks, [['a' * 10] * 4, ['b' * 40]])
+        self.assertEqual(split_into_chunks(range(10), 3, size=lambda item: 1), [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]])
+
+    def test_empty_and_degenerate(self):
+        self.assertEqual(split_into_chunks([], 0), [])
+        self.assertEqual(split_into_chunks([], 4), [])
+        self.assertEqual(split_into_chunks(['ab'], 0), [['ab']])
+        self.assertEqual(len(split_into_chunks([''] * 5, 2)), 2)  # zero-size items
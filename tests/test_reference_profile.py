@@ -0,0 +1,44 @@
+############################################################################
+# Copyright (c) 2015-2018 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from quast_libs import fastaparser, reference_profile
+
+
+class ReferenceProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ref_fpath = os.path.join(self.tmp_dir, 'ref.fasta')
+        fastaparser.write_fasta(self.ref_fpath, [('chr1', 'ACGTNNNNGG' * 50), ('chr2', 'GGCC' * 30 + 'NN')])
+        self.computed = []
+        self.compute = reference_profile._compute
+        reference_profile._compute = lambda *args: self.computed.append(args) or self.compute(*args)
+        reference_profile.profiles_by_fpath.clear()
+
+    def tearDown(self):
+        reference_profile._compute = self.compute
+        reference_profile.profiles_by_fpath.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_genome_stats(self):
+        profile = reference_profile.get(self.ref_fpath)
+        self.assertEqual(profile.get_genome_stats(), fastaparser.get_genome_stats(self.ref_fpath))
+        self.assertEqual(profile.get_genome_stats(skip_ns=True), fastaparser.get_genome_stats(self.ref_fpath, skip_ns=True))
+
+    def test_computed_on_demand_once(self):
+        self.assertIs(reference_profile.get(self.ref_fpath), reference_profile.get(self.ref_fpath))
+        self.assertEqual(len(self.computed), 1)
+
+    def test_saved_profile_is_loaded(self):
+        profile = reference_profile.create(self.ref_fpath, self.tmp_dir)
+        reference_profile.profiles_by_fpath.clear()  # e.g. a process without the registry
+        self.assertEqual(reference_profile.get(self.ref_fpath).chr_lengths, profile.chr_lengths)
+        self.assertEqual(len(self.computed), 1)